@@ -0,0 +1,83 @@
+# microbenchmark: slotted Vector3D with in-place/fused ops vs the old
+# __dict__ vector with one new object per operation
+import timeit
+import tracemalloc
+
+from src.vector3d import Vector3D
+
+class DictVector3D:
+    # the previous Vector3D: per-instance __dict__, every operation allocates
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __add__(self, other):
+        return self.__class__(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return self.__class__(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, scalar):
+        return self.__class__(self.x * scalar, self.y * scalar, self.z * scalar)
+
+    def __matmul__(self, other):
+        return self.__class__(self.x * other.x, self.y * other.y, self.z * other.z)
+
+    def dot(self, other):
+        return self.x * other.x + self.y * other.y + self.z * other.z
+
+    def length(self):
+        return (self.x**2 + self.y**2 + self.z**2) ** 0.5
+
+    def normalize(self):
+        mag = self.length()
+        return self.__class__(self.x / mag, self.y / mag, self.z / mag)
+
+def shade_old(point, normal, eye, light_pos, diffuse, light_color, out):
+    # one light of SimpleMaterial.shade as it was written before
+    light_dir = (light_pos - point).normalize()
+    diff_color = (diffuse @ light_color) * (0.8 * max(normal.dot(light_dir), 0))
+    view_dir = (eye - point).normalize()
+    reflect_dir = (normal * 2 * normal.dot(light_dir) - light_dir).normalize()
+    spec = max(view_dir.dot(reflect_dir), 0) ** 32
+    spec_color = (diffuse @ light_color) * 0.5 * spec
+    return out + (diff_color + spec_color) * 1.5
+
+def shade_new(point, normal, eye, light_pos, diffuse, light_color, out):
+    # the same computation with the in-place and fused helpers
+    light_dir = (light_pos - point).normalize_()
+    n_dot_l = normal.dot(light_dir)
+    out.iadd_product(diffuse, light_color, 0.8 * max(n_dot_l, 0) * 1.5)
+    view_dir = (eye - point).normalize_()
+    spec = max(-view_dir.dot(light_dir.reflect(normal)), 0) ** 32
+    out.iadd_product(diffuse, light_color, 0.5 * spec * 1.5)
+    return out
+
+def bench(cls, shade, repeat=5, number=20000):
+    args = [cls(0.1, 0.2, 0.3), cls(0, 0, 1), cls(1, 2, 10), cls(5, 5, 10),
+            cls(0.9, 0.1, 0.1), cls(1, 1, 1), cls(0, 0, 0)]
+    best = min(timeit.repeat(lambda: shade(*args), repeat=repeat, number=number))
+
+    # bytes allocated by the shading of `number` lights
+    tracemalloc.start()
+    for _ in range(number):
+        shade(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    vectors = [cls(1.0, 2.0, 3.0) for _ in range(100000)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del vectors
+    return best / number * 1e6, size / 100000, peak
+
+if __name__ == "__main__":
+    old_us, old_bytes, old_peak = bench(DictVector3D, shade_old)
+    new_us, new_bytes, new_peak = bench(Vector3D, shade_new)
+    print(f"{'':22s}{'dict, allocating':>18s}{'slots, in-place':>18s}")
+    print(f"{'shade one light (us)':22s}{old_us:18.2f}{new_us:18.2f}")
+    print(f"{'bytes per vector':22s}{old_bytes:18.0f}{new_bytes:18.0f}")
+    print(f"{'peak traced bytes':22s}{old_peak:18d}{new_peak:18d}")
+    print(f"speedup {old_us / new_us:.2f}x, vector size {old_bytes / new_bytes:.2f}x smaller")
@@ -9,22 +9,30 @@ from src.shapes import PlaneUV, ImplicitSurface, ObjectTransform, Cylinder
 
 # --- A CLASSE DO GIRASSOL CONTINUA IGUAL ---
 class SunflowerSurface(ImplicitSurface):
+    # funções do numpy: aceita arrays de pontos (marching vetorizado)
+    # e Intervals (src/interval.py) e Duals (src/dual.py)
+    vectorized = True
+    interval_arithmetic = True
+    dual_numbers = True
+
     def __init__(self, material):
         bbox_min = Vector3D(-2.5, -0.5, -2.5)
         bbox_max = Vector3D(2.5, 0.5, 2.5)
-        super().__init__(material, bbox_min, bbox_max, num_steps=200)
+        # max |grad f| fora da superfície, onde os raios andam; dentro, perto
+        # do eixo, o termo das pétalas em theta não é limitado
+        super().__init__(material, bbox_min, bbox_max, num_steps=200, lipschitz=60)
 
     def function(self, x, y, z):
-        r = math.sqrt(x**2 + z**2)
-        theta = math.atan2(z, x)
+        r = np.sqrt(x**2 + z**2)
+        theta = np.arctan2(z, x)
         
         miolo = x**2 + (2.5 * (y - 0.1))**2 + z**2 - 0.9**2
-        miolo += 0.04 * math.sin(40 * x) * math.sin(40 * z)
+        miolo += 0.04 * np.sin(40 * x) * np.sin(40 * z)
         
-        raio_petala = 0.8 + 1.4 * abs(math.cos(7 * theta))
+        raio_petala = 0.8 + 1.4 * np.abs(np.cos(7 * theta))
         petalas = r**2 + (12.0 * y)**2 - raio_petala**2
         
-        return min(miolo, petalas)
+        return np.minimum(miolo, petalas)
 
 # --- A NOVA CENA DO JARDIM ---
 class Scene(BaseScene):
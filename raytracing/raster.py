@@ -2,72 +2,263 @@ import random
 import argparse
 import importlib
 from itertools import product
-from functools import partial
 from multiprocessing import Pool
+from multiprocessing.util import Finalize
 
 import numpy as np
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
-from src.base import Color
+from src.checkpoint import Checkpoint, from_sums, merge_checkpoints, write_seeds
+from src.framebuffer import FrameBuffer
+from src.integrator import trace
+from src.ray import Ray
+from src.sampler import Samplers, make_sampler, sample_dimensions
+from src.vector3d import Vector3D
 
 class Context:
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
 
-def render_pixel(context, ij):
-    i, j = ij
-    pixel = Color(0, 0, 0)
-    for _ in range(context.num_samples):
-        # random offset for anti-aliasing
-        dx = np.random.uniform(-0.5, 0.5)
-        dy = np.random.uniform(-0.5, 0.5)
-        # middle of pixel coordinates
-        x = j + 0.5 + dx
-        y = i + 0.5 + dy
-        # ray from camera
-        ray = context.camera.ray(x, y)
-        # hit ray with scene
-        hit_rec = context.scene.hit(ray)
-        # test if hit something
-        if hit_rec.hit:
-            # Simple shading: use the red channel as intensity
-            material = hit_rec.material
-            shaded_color = material.shade(hit_rec, context.scene)
-            # this is box filtering!
-            pixel = pixel + shaded_color / context.num_samples
-        else:
-            # this is box filtering!
-            pixel = pixel + context.scene.background / context.num_samples
-    return (i, j, pixel)
-
-def main(args, pool):
-    # load scene from file args.scene
+def pixel_samples(context, i, j, num_samples, first=0, points=None):
+    # radiance of samples first .. first + num_samples - 1 of pixel (i, j), as a num_samples x 3 array
+    samples = np.zeros((num_samples, 3))
+    # sampler dimensions: anti-aliasing offset, lens position, then one pair per light
+    if points is None:
+        points = context.sampler.pixel(i, j, first, num_samples)
+    dx = points[:, 0] - 0.5
+    dy = points[:, 1] - 0.5
+    # rays from camera through the jittered pixel positions
+    origins, directions = context.camera.rays(j + 0.5 + dx, i + 0.5 + dy, points[:, 2:4])
+    light_points = points[:, 4:].tolist()
+    rays = [Ray(Vector3D(*origin), Vector3D(*direction), context.camera.ray_depth, light_points[k])
+            for k, (origin, direction) in enumerate(zip(origins.tolist(), directions.tolist()))]
+    # all samples of the pixel travel together, one wave per bounce
+    for k, color in enumerate(trace(context.scene, rays)):
+        samples[k] = (color.x, color.y, color.z)
+    return samples
+
+def merge_stats(count, mean, m2, samples):
+    # Welford/Chan update of the running mean and sum of squared deviations with a new batch
+    n = len(samples)
+    batch_mean = samples.mean(axis=0)
+    batch_m2 = ((samples - batch_mean)**2).sum(axis=0)
+    total = count + n
+    delta = batch_mean - mean
+    mean = mean + delta * (n / total)
+    m2 = m2 + batch_m2 + delta**2 * (count * n / total)
+    return total, mean, m2
+
+def adaptive_pixel(context, i, j, points=None):
+    # starts with min_samples and keeps adding batches while the 95% confidence
+    # interval of some channel is wider than the tolerance, up to num_samples;
+    # points, if given, are the sampler points of the first batch
+    count, mean, m2 = 0, np.zeros(3), np.zeros(3)
+    batch = min(context.min_samples, context.num_samples)
+    while batch > 0:
+        count, mean, m2 = merge_stats(count, mean, m2, pixel_samples(context, i, j, batch, count, points))
+        points = None
+        batch = min(context.batch_size, context.num_samples - count)
+        # the variance needs two samples, before that the batches just go on
+        if count < 2:
+            continue
+        variance = m2 / (count - 1)
+        if 1.96 * np.sqrt(variance.max() / count) <= context.tolerance:
+            break
+    variance = m2 / (count - 1) if count > 1 else np.zeros(3)
+    return mean, variance, count
+
+def make_tiles(img_width, img_height, tile_size, order='scanline', seed=None):
+    # tiles are (i0, i1, j0, j1) row/column ranges
+    tiles = [(i0, min(i0 + tile_size, img_height), j0, min(j0 + tile_size, img_width))
+             for i0 in range(0, img_height, tile_size)
+             for j0 in range(0, img_width, tile_size)]
+    if order == 'center':
+        # middle of the image first, it is usually where the subject is
+        ci, cj = img_height / 2, img_width / 2
+        tiles.sort(key=lambda t: ((t[0] + t[1]) / 2 - ci)**2 + ((t[2] + t[3]) / 2 - cj)**2)
+    elif order == 'random':
+        random.Random(seed).shuffle(tiles)
+    return tiles
+
+def seed_tile(seed, tile):
+    # the random state depends only on the tile, not on which worker renders it
+    # or when, so a fixed seed gives the same image for any number of jobs
+    state = np.random.SeedSequence([seed, tile[0], tile[2]]).generate_state(2)
+    np.random.seed(state[0])
+    random.seed(int(state[1]))
+
+def load_context(args):
+    # load scene from file args.scene, plus its acceleration structures
     scene = importlib.import_module(args.scene).Scene()
-    camera = scene.camera
+    if args.bvh:
+        scene.build_bvh()
+    if args.roulette is not None:
+        scene.roulette_threshold = args.roulette
+    if args.light_samples is not None:
+        scene.light_samples = args.light_samples
+    for light in scene.lights:
+        if hasattr(light, 'set_grid'):
+            if args.light_grid is not None:
+                light.set_grid(args.light_grid)
+            if args.adaptive_shadows:
+                light.adaptive_shadows = True
+        if args.shadow_map is not None and hasattr(light, 'set_shadow_map'):
+            light.set_shadow_map(args.shadow_map, args.shadow_bias, args.shadow_pcf)
+    sampler = make_sampler(args.sampler, sample_dimensions(len(scene.lights)), args.seed)
+    # without --adaptive every pixel takes exactly num_samples
+    min_samples = args.min_samples if args.adaptive else args.num_samples
+    return Context(scene=scene, camera=scene.camera, sampler=sampler, num_samples=args.num_samples, seed=args.seed,
+                   min_samples=min_samples, batch_size=args.batch_size, tolerance=args.tolerance)
+
+# per-process render state, set once by init_worker (or by main with -j 1)
+context = None
+framebuffer = None
+
+def render_shadow_maps(scene):
+    # depth of the cube shadow map of each light (None without one), rendered
+    # once by the main process instead of once per worker
+    depths = list()
+    for light in scene.lights:
+        shadow_map = getattr(light, 'shadow_map', None)
+        depth = None
+        if shadow_map is not None:
+            depth = shadow_map.render(scene)
+            shadow_map.load(depth)
+        depths.append(depth)
+    return depths
+
+def init_worker(args, framebuffer_name, img_width, img_height, shadow_depths):
+    # each worker builds its own scene once, so tasks only carry tile coordinates
+    global context, framebuffer
+    context = load_context(args)
+    for light, depth in zip(context.scene.lights, shadow_depths):
+        if depth is not None:
+            light.shadow_map.load(depth)
+    framebuffer = FrameBuffer(img_width, img_height, name=framebuffer_name)
+    # workers leave through os._exit, which skips atexit; multiprocessing
+    # runs its own finalizers first, so the handle is closed there
+    Finalize(framebuffer, framebuffer.close, exitpriority=10)
+
+def shadow_ray_counts(scene):
+    # (cast, saved) shadow rays of the sampled area lights, one row per light
+    return np.array([(getattr(light, 'shadow_rays', 0), getattr(light, 'shadow_rays_saved', 0))
+                     for light in scene.lights], dtype=np.int64).reshape(-1, 2)
+
+def render_tile(tile):
+    i0, i1, j0, j1 = tile
+    shadow_rays = shadow_ray_counts(context.scene)
+    if context.seed is not None:
+        seed_tile(context.seed, tile)
+    shape = (i1 - i0, j1 - j0)
+    rgb = np.zeros(shape + (3,))
+    variance = np.zeros(shape + (3,))
+    count = np.zeros(shape)
+    # first batch of every pixel of the tile in one sampler call
+    points = context.sampler.tile(tile, 0, min(context.min_samples, context.num_samples))
+    for i, j in product(range(i0, i1), range(j0, j1)):
+        k = (i - i0, j - j0)
+        rgb[k], variance[k], count[k] = adaptive_pixel(context, i, j, points[k])
+    # the tile goes straight to shared memory, only its coordinates
+    # (and the shadow rays it cast) travel back
+    framebuffer.write_tile(tile, rgb, count, variance)
+    return tile, shadow_ray_counts(context.scene) - shadow_rays
+
+def render_tiles(tiles, pool=None):
+    # yields tiles as they finish; workers pull one tile at a time
+    # from the queue so expensive tiles do not stall a fixed partition
+    if pool is None:
+        return map(render_tile, tiles)
+    return pool.imap_unordered(render_tile, tiles, chunksize=1)
+
+def print_shadow_rays(scene, shadow_rays):
+    for index, (light, (cast, saved)) in enumerate(zip(scene.lights, shadow_rays)):
+        if getattr(light, 'adaptive_shadows', False) and cast + saved > 0:
+            print(f"Light {index}: {cast} shadow rays cast, {saved} saved ({100 * saved / (cast + saved):.1f}%)")
+
+def print_sample_histogram(fb):
+    # realized samples per pixel; adaptive counts only take min_samples + k * batch_size values
+    counts = fb.count.ravel()
+    print(f"Samples per pixel: mean {counts.mean():.1f}, min {counts.min():.0f}, max {counts.max():.0f}")
+    values, pixels = np.unique(counts, return_counts=True)
+    for value, n in zip(values, pixels):
+        print(f"  {value:6.0f} spp: {n:8d} pixels ({100 * n / len(counts):5.1f}%)")
+
+def save_image(args, fb):
+    # save image as png using matplotlib
+    plt.imsave(args.output, fb.snapshot(), vmin=0, vmax=1, origin='lower')
+
+def merge_main(args):
+    # combines the accumulation buffers of independent runs into one image, no rendering
+    sums, seeds = merge_checkpoints(args.merge)
+    mean, _, count = from_sums(sums)
+    print(f"Merged {len(args.merge)} checkpoints: {count.mean():.1f} samples per pixel on average")
+    if args.checkpoint:
+        np.save(args.checkpoint, sums)
+        write_seeds(args.checkpoint, seeds)
+    plt.imsave(args.output, np.clip(mean, 0, 1), vmin=0, vmax=1, origin='lower')
+
+def main(args):
+    global context, framebuffer
+    if args.merge:
+        return merge_main(args)
+
+    if args.seed is None:
+        # workers must agree on the seed; report it so the render can be repeated
+        args.seed = int(np.random.SeedSequence().entropy % 2**32)
+        print("Seed:", args.seed)
+    context = load_context(args)
+    shadow_depths = render_shadow_maps(context.scene)
+    camera = context.camera
     img_width = camera.img_width
     img_height = camera.img_height
-    image = np.zeros((img_height, img_width, 3)) # create tensor for image: RGB
-
-    # for each pixel, determine if it is inside any primitive in the scene
-    # use cartesian product for efficiency
-    print("Rendering... with anti-aliasing samples:", args.num_samples)
-    context = Context(scene=scene, camera=camera, num_samples=args.num_samples)
-    with tqdm(total=img_height*img_width) as pbar:
-        if args.num_jobs <= 1:
-            for i, j in product(range(img_height), range(img_width)):
-                _, _, pixel = render_pixel(context, (i, j))
-                image[i, j] = np.clip(pixel.as_list(), 0, 1)
-                pbar.update(1)
-                pbar.refresh()
-        else:
-            for i, j, pixel in pool.imap(partial(render_pixel, context), product(range(img_height), range(img_width))):
-                image[i, j] = np.clip(pixel.as_list(), 0, 1)
-                pbar.update(1)
-                pbar.refresh()
+    # image tensor (RGB) shared with the workers
+    framebuffer = FrameBuffer(img_width, img_height)
 
-    # save image as png using matplotlib
-    plt.imsave(args.output, image, vmin=0, vmax=1, origin='lower')
+    # the image is split in tiles, each task renders a whole tile
+    tiles = make_tiles(img_width, img_height, args.tile_size, args.tile_order, args.seed)
+    checkpoint = None
+    if args.checkpoint:
+        # tiles already in the checkpoint are kept, the others are rendered
+        checkpoint = Checkpoint(args.checkpoint, img_width, img_height, args.seed)
+        checkpoint.load_into(framebuffer)
+        pending = [tile for tile in tiles if not checkpoint.tile_done(tile)]
+        if len(pending) < len(tiles):
+            print(f"Resuming from {args.checkpoint}: {len(tiles) - len(pending)} of {len(tiles)} tiles done")
+        tiles = pending
+
+    if args.adaptive:
+        print(f"Rendering... with adaptive anti-aliasing: {context.min_samples} to {args.num_samples} samples, tolerance {args.tolerance}")
+    else:
+        print("Rendering... with anti-aliasing samples:", args.num_samples)
+    pool = None
+    if args.num_jobs > 1:
+        # create a pool of workers for parallel processing
+        pool = Pool(args.num_jobs, initializer=init_worker,
+                    initargs=(args, framebuffer.name, img_width, img_height, shadow_depths))
+    try:
+        shadow_rays = shadow_ray_counts(context.scene)
+        with tqdm(total=sum((i1 - i0) * (j1 - j0) for i0, i1, j0, j1 in tiles)) as pbar:
+            for done, (tile, tile_shadow_rays) in enumerate(render_tiles(tiles, pool), 1):
+                shadow_rays += tile_shadow_rays
+                i0, i1, j0, j1 = tile
+                if checkpoint is not None:
+                    checkpoint.store_tile(tile, framebuffer.rgb[i0:i1, j0:j1],
+                                          framebuffer.variance[i0:i1, j0:j1], framebuffer.count[i0:i1, j0:j1])
+                pbar.update((i1 - i0) * (j1 - j0))
+                if args.preview_every and done % args.preview_every == 0:
+                    save_image(args, framebuffer)
+        save_image(args, framebuffer)
+        print_shadow_rays(context.scene, shadow_rays)
+        if args.adaptive:
+            print_sample_histogram(framebuffer)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if checkpoint is not None:
+            checkpoint.close()
+        framebuffer.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Raster module main function")
@@ -75,10 +266,25 @@ if __name__ == "__main__":
     parser.add_argument('-n', '--num_samples', type=int, help='Number of samples per pixel for anti-aliasing', default=100)
     parser.add_argument('-j', '--num_jobs', type=int, help='Number of parallel jobs for rendering', default=8)
     parser.add_argument('-o', '--output', type=str, help='Output image file name', default='dof_0,8_5.png')
+    parser.add_argument('--bvh', action='store_true', help='Build a bounding volume hierarchy to accelerate ray-scene intersection')
+    parser.add_argument('-t', '--tile_size', type=int, help='Size in pixels of the square tiles sent to the workers', default=16)
+    parser.add_argument('--tile_order', type=str, choices=['scanline', 'center', 'random'], help='Order in which tiles are queued', default='scanline')
+    parser.add_argument('--seed', type=int, help='Seed the random numbers of every tile, making the output reproducible for any number of jobs', default=None)
+    parser.add_argument('--preview_every', type=int, help='Save the partial image every N finished tiles (0 disables)', default=0)
+    parser.add_argument('--sampler', type=str, choices=sorted(Samplers), help='Sample generator for the pixel, lens and light dimensions', default='independent')
+    parser.add_argument('--light_grid', type=int, help='Shade area lights with a k x k grid of shadow rays per hit (overrides the scene)', default=None)
+    parser.add_argument('--adaptive_shadows', action='store_true', help='Area lights test their corner cells first and cast the other shadow rays only in penumbrae')
+    parser.add_argument('--shadow_map', type=int, help='Point lights use a cube shadow map with this many texels per face side instead of shadow rays, exact except near shadow edges (overrides the scene, 0 disables)', default=None)
+    parser.add_argument('--shadow_bias', type=float, help='Shadow map depth and normal offset, in texels', default=1.5)
+    parser.add_argument('--shadow_pcf', type=int, help='Shadow map filter radius in texels (0 is a single hard lookup)', default=1)
+    parser.add_argument('--light_samples', type=int, help='Lights shaded per hit, picked at random by estimated contribution (overrides the scene, 0 shades every light)', default=None)
+    parser.add_argument('--roulette', type=float, help='Throughput below which reflected/refracted paths are terminated by Russian roulette (overrides the scene, 0 disables)', default=None)
+    parser.add_argument('--adaptive', action='store_true', help='Adaptive sampling: stop sampling a pixel once its noise is below the tolerance (-n is the cap)')
+    parser.add_argument('--min_samples', type=int, help='Samples every pixel takes before the adaptive test', default=16)
+    parser.add_argument('--batch_size', type=int, help='Samples added per adaptive iteration', default=8)
+    parser.add_argument('--tolerance', type=float, help='Largest accepted half-width of the 95%% confidence interval of a pixel channel', default=0.01)
+    parser.add_argument('--checkpoint', type=str, help='Accumulation buffer (.npy) saved after every tile; an existing one is resumed', default=None)
+    parser.add_argument('--merge', type=str, nargs='+', help='Merge the checkpoints of independent runs (different --seed) into one image instead of rendering', default=None)
     args = parser.parse_args()
 
-    # create a pool of workers for parallel processing
-    pool = Pool(args.num_jobs)
-    main(args, pool)
-    pool.close()
-    pool.join()
\ No newline at end of file
+    main(args)
\ No newline at end of file
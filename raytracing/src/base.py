@@ -1,18 +1,95 @@
+import numpy as np
+
 from .ray import Ray
 from .camera import Camera
 from .vector3d import Vector3D
 
 CastEpsilon = 1e-4
+# smaller waves are not worth packing into arrays
+WaveBatchMin = 64
 
 class Shape:
+    # shapes whose hit_batch is a real vectorized kernel, not the per-ray
+    # fallback below, set vectorized = True; occludes_batch then uses it too
+    vectorized = False
+
     def __init__(self, type):
         self.type = type
 
-    def hit(self, ray):
-        # Placeholder method for point-in-primitive test
-        raise NotImplementedError("in_out method not implemented")
+    # Shapes answer two questions: intersect() is the cheap one, asked of every
+    # candidate shape, and returns the distance t of the nearest hit with
+    # t_min < t < t_max (None on a miss) without building anything;
+    # surface_info() builds the full HitRecord and is only called for the
+    # closest hit along the ray. t_max is usually the closest hit found so far,
+    # so shapes can give up as soon as they know they are farther away.
+    def intersect(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        raise NotImplementedError("intersect method not implemented")
+
+    def surface_info(self, ray, t):
+        raise NotImplementedError("surface_info method not implemented")
+
+    def occludes(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        # any-hit test for shadow rays: is there some hit with t_min < t < t_max?
+        # Shapes override it when they can answer without finding the nearest one.
+        return self.intersect(ray, t_min, t_max) is not None
+
+    def hit(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        t = self.intersect(ray, t_min, t_max)
+        if t is None:
+            return MISS
+        return self.surface_info(ray, t)
+
+    def bounding_box(self):
+        # world-space (min, max) corners, None for unbounded shapes
+        return None
+
+    def tighten_bbox(self):
+        # shapes with a conservative box shrink it here, see BaseScene.add
+        pass
+
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        # intersects N rays (N x 3 arrays) at once and returns
+        # t (N,), normal (N x 3) and uv (N x 2); t is inf on a miss.
+        # With need_normals=False the caller only reads t, and kernels may
+        # leave normal and uv at zero instead of computing them.
+        # Fallback for shapes without a vectorized kernel: one hit() per ray.
+        n = len(origins)
+        t = np.full(n, np.inf)
+        normal = np.zeros((n, 3))
+        uv = np.zeros((n, 2))
+        t_max = np.broadcast_to(t_max, (n,))
+        for k, (o, d) in enumerate(zip(origins.tolist(), directions.tolist())):
+            ray = Ray(Vector3D(*o), Vector3D(*d))
+            t_hit = self.intersect(ray, CastEpsilon, t_max[k])
+            if t_hit is not None:
+                t[k] = t_hit
+                if not need_normals:
+                    continue
+                rec = self.surface_info(ray, t_hit)
+                normal[k] = (rec.normal.x, rec.normal.y, rec.normal.z)
+                if rec.uv is not None:
+                    uv[k] = (rec.uv.x, rec.uv.y)
+        return t, normal, uv
+
+    def occludes_batch(self, origins, directions, t_min, t_max):
+        # any-hit version of hit_batch for N shadow rays, a boolean array;
+        # without a vectorized kernel every ray gets the cheap occludes()
+        n = len(origins)
+        t_min = np.broadcast_to(t_min, (n,))
+        t_max = np.broadcast_to(t_max, (n,))
+        if self.vectorized:
+            # the kernels only take hits past CastEpsilon: moving the origins
+            # by t_min - CastEpsilon makes that t_min
+            shift = (t_min - CastEpsilon)[:, None]
+            t, _, _ = self.hit_batch(origins + directions * shift, directions, t_max - shift[:, 0], need_normals=False)
+            return t + shift[:, 0] < t_max
+        return np.array([self.occludes(Ray(Vector3D(*o), Vector3D(*d)), t0, t1)
+                         for o, d, t0, t1 in zip(origins.tolist(), directions.tolist(), t_min.tolist(), t_max.tolist())],
+                        dtype=bool)
 
 class Color(Vector3D):
+    __slots__ = ()
+
     def __init__(self, r, g, b):
         super().__init__(r, g, b)
 
@@ -52,30 +129,151 @@ class BaseScene:
             img_width=800,
             img_height=600
         )
+        # acceleration structure, only used after build_bvh()
+        self.bvh = None
+        # reflected/refracted paths with a smaller throughput play Russian
+        # roulette (0 traces every path up to max_depth)
+        self.roulette_threshold = 0.0
+        # index of the shape that blocked the last shadow ray, per light
+        self.last_occluder = dict()
+        # lights shaded per hit, drawn by importance (0 shades every light)
+        self.light_samples = 0
+        self.light_selector = None
 
     def display(self):
         print(f"Scene: {self.name}")
 
     def add(self, primitive, material):
+        primitive.tighten_bbox()
         self.shapes.append(primitive)
         self.materials.append(material)
+        # the hierarchy no longer covers every shape
+        self.bvh = None
+
+    def build_bvh(self, max_leaf_size=4, num_bins=12):
+        from .bvh import BVH
+        self.bvh = BVH(self.shapes, max_leaf_size, num_bins)
+        return self.bvh
+
+    def select_lights(self, point, normal):
+        # (index, weight) of the lights whose direct light a hit adds
+        if not self.light_samples or self.light_samples >= len(self.lights):
+            return [(index, 1.0) for index in range(len(self.lights))]
+        if self.light_selector is None:
+            from .light import LightSelector
+            self.light_selector = LightSelector(self.lights)
+        return self.light_selector.draw(point, normal, self.light_samples)
 
     # add iterator support for primitives zip and colors
     def __iter__(self):
         return iter(zip(self.shapes, self.materials))
-    def hit(self, ray):
-        # check for hits with all shapes
-        hit_rec = HitRecord()
-        for shape, material in zip(self.shapes, self.materials):
-            new_hit = shape.hit(ray)
-            if new_hit.hit and new_hit.t < hit_rec.t and new_hit.t > CastEpsilon:
-                hit_rec = new_hit
-                # set material
-                hit_rec.material = material
-                hit_rec.ray = ray
+
+    def hit(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        if self.bvh is not None:
+            closest, closest_t = self.bvh.closest(ray, t_min, t_max)
+        else:
+            # check for hits with all shapes, only the distances;
+            # each shape only searches in front of the closest hit so far
+            closest_t, closest = t_max, None
+            for index, shape in enumerate(self.shapes):
+                t = shape.intersect(ray, t_min, closest_t)
+                if t is not None:
+                    closest_t, closest = t, index
+        if closest is None:
+            return MISS
+        return self.hit_record(closest, ray, closest_t)
+
+    def occluded(self, origin, direction, max_dist, cache_key=None):
+        # any-hit query for shadow rays: stops at the first shape blocking the
+        # segment origin + direction * t, CastEpsilon < t < max_dist.
+        # Neighbouring shadow rays towards the same light (cache_key) are usually
+        # blocked by the same shape, so the last occluder is tried first.
+        ray = Ray(origin, direction)
+        last = self.last_occluder.get(cache_key)
+        if last is not None and self.shapes[last].occludes(ray, CastEpsilon, max_dist):
+            return True
+
+        if self.bvh is not None:
+            index = self.bvh.any_hit(ray, CastEpsilon, max_dist, last)
+        else:
+            index = None
+            for k, shape in enumerate(self.shapes):
+                if k != last and shape.occludes(ray, CastEpsilon, max_dist):
+                    index = k
+                    break
+        if index is None:
+            return False
+        if cache_key is not None:
+            self.last_occluder[cache_key] = index
+        return True
+
+    def occluded_batch(self, origins, directions, max_dist):
+        # occluded() for N shadow rays (N x 3 arrays) in one query, a boolean array.
+        # Without a bvh each shape tests, in one call, the rays still unblocked
+        n = len(origins)
+        max_dist = np.broadcast_to(max_dist, (n,))
+        if self.bvh is not None:
+            return np.array([self.occluded(Vector3D(*o), Vector3D(*d), t)
+                             for o, d, t in zip(origins.tolist(), directions.tolist(), max_dist.tolist())], dtype=bool)
+        blocked = np.zeros(n, dtype=bool)
+        for shape in self.shapes:
+            open_rays = np.flatnonzero(~blocked)
+            if len(open_rays) == 0:
+                break
+            blocked[open_rays] = shape.occludes_batch(origins[open_rays], directions[open_rays],
+                                                      CastEpsilon, max_dist[open_rays])
+        return blocked
+
+    def hit_wave(self, rays):
+        # closest hit (or MISS) of each ray of a wave. Without a bvh the whole
+        # wave goes through the vectorized hit_batch kernels, shape by shape,
+        # and only the surface information of the hits is built per ray, so
+        # the kernels skip their normals
+        if self.bvh is not None or len(rays) < WaveBatchMin:
+            return [self.hit(ray) for ray in rays]
+        origins = np.array([(r.origin.x, r.origin.y, r.origin.z) for r in rays])
+        directions = np.array([(r.direction.x, r.direction.y, r.direction.z) for r in rays])
+        t, _, _, index = self.hit_batch(origins, directions, need_normals=False)
+        return [self.hit_record(k, ray, t_hit) if k >= 0 else MISS
+                for ray, t_hit, k in zip(rays, t.tolist(), index.tolist())]
+
+    def hit_distances(self, origins, directions):
+        # distance to the nearest hit of each of N rays (inf on a miss),
+        # nothing else; used to render depth maps
+        if self.bvh is None:
+            return self.hit_batch(origins, directions, need_normals=False)[0]
+        return np.array([self.bvh.closest(Ray(Vector3D(*o), Vector3D(*d)), CastEpsilon, float('inf'))[1]
+                         for o, d in zip(origins.tolist(), directions.tolist())])
+
+    def hit_record(self, index, ray, t):
+        # full hit information for the closest shape only
+        hit_rec = self.shapes[index].surface_info(ray, t)
+        # set material
+        hit_rec.material = self.materials[index]
+        hit_rec.ray = ray
         return hit_rec
 
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        # nearest hit for each of N rays; index is the shape position in
+        # self.shapes (and self.materials), -1 when the ray hits nothing
+        n = len(origins)
+        t = np.array(np.broadcast_to(t_max, (n,)), dtype=float)
+        normal = np.zeros((n, 3))
+        uv = np.zeros((n, 2))
+        index = np.full(n, -1)
+        for k, shape in enumerate(self.shapes):
+            new_t, new_normal, new_uv = shape.hit_batch(origins, directions, t, need_normals)
+            closer = new_t < t
+            t[closer] = new_t[closer]
+            normal[closer] = new_normal[closer]
+            uv[closer] = new_uv[closer]
+            index[closer] = k
+        t[index < 0] = np.inf
+        return t, normal, uv, index
+
 class HitRecord:
+    __slots__ = ('hit', 't', 'point', 'normal', 'material', 'ray', 'uv')
+
     def __init__(self, hit=False, t=float('inf'), point=None, normal=None, material=None, ray=None, uv=None):
         self.hit = hit
         self.t = t
@@ -85,10 +283,29 @@ class HitRecord:
         self.ray = ray
         self.uv = uv
 
+class Miss:
+    # the result of every ray that hits nothing: a single shared instance
+    # with the same fields as HitRecord, read-only so nobody can modify it
+    __slots__ = ()
+    hit = False
+    t = float('inf')
+    point = None
+    normal = None
+    material = None
+    ray = None
+    uv = None
+
+MISS = Miss()
+
 class Material:
     def __init__(self):
         pass
 
     def shade(self, hit_record, scene):
         # Placeholder method for shading
-        raise NotImplementedError("shade method not implemented")
\ No newline at end of file
+        raise NotImplementedError("shade method not implemented")
+
+    def scatter(self, hit_record, scene):
+        # (local color, [(secondary ray, weight), ...]) used by the integrator;
+        # materials that spawn no rays are just their shade()
+        return self.shade(hit_record, scene), ()
\ No newline at end of file
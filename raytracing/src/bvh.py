@@ -0,0 +1,241 @@
+import numpy as np
+
+# small padding so hits found exactly on a box face are not culled
+BoxEpsilon = 1e-6
+
+class BVHNode:
+    __slots__ = ("bmin", "bmax", "left", "right", "first", "count")
+
+    def __init__(self, bmin, bmax):
+        # bounds are kept as plain python floats, traversal runs in interpreted code
+        self.bmin = bmin
+        self.bmax = bmax
+        self.left = None
+        self.right = None
+        self.first = 0
+        self.count = 0
+
+    def is_leaf(self):
+        return self.left is None
+
+class BVH:
+    def __init__(self, shapes, max_leaf_size=4, num_bins=12):
+        self.shapes = shapes
+        self.max_leaf_size = max_leaf_size
+        self.num_bins = num_bins
+
+        # shapes without a finite box (planes) are always tested
+        self.unbounded = list()
+        bounded, boxes = list(), list()
+        for index, shape in enumerate(shapes):
+            box = shape.bounding_box()
+            if box is None:
+                self.unbounded.append(index)
+            else:
+                bounded.append(index)
+                boxes.append([box[0].x, box[0].y, box[0].z, box[1].x, box[1].y, box[1].z])
+
+        self.indices = list()
+        self.root = None
+        if bounded:
+            boxes = np.array(boxes, dtype=float)
+            boxes[:, :3] -= BoxEpsilon
+            boxes[:, 3:] += BoxEpsilon
+            self.boxes = boxes
+            self.centroids = (boxes[:, :3] + boxes[:, 3:]) * 0.5
+            order = np.arange(len(bounded))
+            self.root = self._build(order)
+            self.indices = [bounded[k] for k in self._order]
+            del self.boxes, self.centroids
+
+    # --- construction (binned SAH) ---
+
+    def _build(self, order):
+        self._order = list()
+        return self._build_node(order)
+
+    @staticmethod
+    def _area(bmin, bmax):
+        d = np.maximum(bmax - bmin, 0.0)
+        return 2.0 * (d[..., 0] * d[..., 1] + d[..., 1] * d[..., 2] + d[..., 2] * d[..., 0])
+
+    def _make_leaf(self, node, order):
+        node.first = len(self._order)
+        node.count = len(order)
+        self._order.extend(order.tolist())
+        return node
+
+    def _build_node(self, order):
+        boxes = self.boxes[order]
+        bmin = boxes[:, :3].min(axis=0)
+        bmax = boxes[:, 3:].max(axis=0)
+        node = BVHNode(bmin.tolist(), bmax.tolist())
+
+        if len(order) <= self.max_leaf_size:
+            return self._make_leaf(node, order)
+
+        split = self._find_split(order, boxes)
+        if split is None:
+            return self._make_leaf(node, order)
+
+        axis, position = split
+        mask = self.centroids[order, axis] < position
+        left, right = order[mask], order[~mask]
+        if len(left) == 0 or len(right) == 0:
+            return self._make_leaf(node, order)
+
+        node.left = self._build_node(left)
+        node.right = self._build_node(right)
+        return node
+
+    def _find_split(self, order, boxes):
+        centroids = self.centroids[order]
+        cmin = centroids.min(axis=0)
+        cmax = centroids.max(axis=0)
+        parent_area = self._area(boxes[:, :3].min(axis=0), boxes[:, 3:].max(axis=0))
+        # cost of not splitting: intersect every primitive
+        best_cost = float(len(order))
+        best = None
+
+        for axis in range(3):
+            extent = cmax[axis] - cmin[axis]
+            if extent <= 0:
+                continue
+            bins = ((centroids[:, axis] - cmin[axis]) / extent * self.num_bins).astype(int)
+            bins = np.minimum(bins, self.num_bins - 1)
+
+            counts = np.zeros(self.num_bins, dtype=int)
+            bin_min = np.full((self.num_bins, 3), np.inf)
+            bin_max = np.full((self.num_bins, 3), -np.inf)
+            for b in range(self.num_bins):
+                inside = bins == b
+                counts[b] = inside.sum()
+                if counts[b]:
+                    bin_min[b] = boxes[inside, :3].min(axis=0)
+                    bin_max[b] = boxes[inside, 3:].max(axis=0)
+
+            # sweep the bins from both sides to evaluate each of the num_bins-1 planes
+            left_count = np.cumsum(counts)[:-1]
+            right_count = np.cumsum(counts[::-1])[::-1][1:]
+            left_area = self._area(np.minimum.accumulate(bin_min)[:-1],
+                                   np.maximum.accumulate(bin_max)[:-1])
+            right_area = self._area(np.minimum.accumulate(bin_min[::-1])[::-1][1:],
+                                    np.maximum.accumulate(bin_max[::-1])[::-1][1:])
+            with np.errstate(invalid="ignore"):
+                cost = 0.125 + (left_count * left_area + right_count * right_area) / parent_area
+            cost[(left_count == 0) | (right_count == 0)] = np.inf
+
+            k = int(np.argmin(cost))
+            if cost[k] < best_cost:
+                best_cost = cost[k]
+                best = (axis, cmin[axis] + extent * (k + 1) / self.num_bins)
+
+        return best
+
+    # --- traversal ---
+
+    def closest(self, ray, t_min, t_max):
+        # (index, t) of the nearest shape along the ray with t_min < t < t_max,
+        # index None on a miss
+        closest_t, closest = t_max, None
+        for index in self.unbounded:
+            t = self.shapes[index].intersect(ray, t_min, closest_t)
+            if t is not None:
+                closest_t, closest = t, index
+
+        if self.root is None:
+            return closest, closest_t
+
+        ox, oy, oz = ray.origin.x, ray.origin.y, ray.origin.z
+        dx, dy, dz = ray.direction.x, ray.direction.y, ray.direction.z
+        ix = 1.0 / dx if dx != 0 else 1e30
+        iy = 1.0 / dy if dy != 0 else 1e30
+        iz = 1.0 / dz if dz != 0 else 1e30
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            t_near = self._slab(node, ox, oy, oz, ix, iy, iz, t_min, closest_t)
+            if t_near is None:
+                continue
+            if node.is_leaf():
+                for k in range(node.first, node.first + node.count):
+                    index = self.indices[k]
+                    t = self.shapes[index].intersect(ray, t_min, closest_t)
+                    if t is not None:
+                        closest_t, closest = t, index
+                continue
+
+            # push the far child first so the near one is popped next
+            t_left = self._slab(node.left, ox, oy, oz, ix, iy, iz, t_min, closest_t)
+            t_right = self._slab(node.right, ox, oy, oz, ix, iy, iz, t_min, closest_t)
+            if t_left is None:
+                if t_right is not None:
+                    stack.append(node.right)
+            elif t_right is None:
+                stack.append(node.left)
+            elif t_left <= t_right:
+                stack.append(node.right)
+                stack.append(node.left)
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        return closest, closest_t
+
+    def any_hit(self, ray, t_min, t_max, skip=None):
+        # index of some shape hit with t_min < t < t_max, None if there is none;
+        # no ordering needed, the first blocker found ends the traversal.
+        # skip is a shape the caller already tested
+        for index in self.unbounded:
+            if index != skip and self.shapes[index].occludes(ray, t_min, t_max):
+                return index
+
+        if self.root is None:
+            return None
+
+        ox, oy, oz = ray.origin.x, ray.origin.y, ray.origin.z
+        dx, dy, dz = ray.direction.x, ray.direction.y, ray.direction.z
+        ix = 1.0 / dx if dx != 0 else 1e30
+        iy = 1.0 / dy if dy != 0 else 1e30
+        iz = 1.0 / dz if dz != 0 else 1e30
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if self._slab(node, ox, oy, oz, ix, iy, iz, t_min, t_max) is None:
+                continue
+            if node.is_leaf():
+                for k in range(node.first, node.first + node.count):
+                    index = self.indices[k]
+                    if index != skip and self.shapes[index].occludes(ray, t_min, t_max):
+                        return index
+            else:
+                stack.append(node.right)
+                stack.append(node.left)
+        return None
+
+    @staticmethod
+    def _slab(node, ox, oy, oz, ix, iy, iz, t_min, t_max):
+        bmin, bmax = node.bmin, node.bmax
+        t1 = (bmin[0] - ox) * ix
+        t2 = (bmax[0] - ox) * ix
+        t_near, t_far = (t1, t2) if t1 < t2 else (t2, t1)
+        t1 = (bmin[1] - oy) * iy
+        t2 = (bmax[1] - oy) * iy
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > t_near:
+            t_near = t1
+        if t2 < t_far:
+            t_far = t2
+        t1 = (bmin[2] - oz) * iz
+        t2 = (bmax[2] - oz) * iz
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > t_near:
+            t_near = t1
+        if t2 < t_far:
+            t_far = t2
+        if t_far < t_min or t_near > t_far or t_near > t_max:
+            return None
+        return t_near
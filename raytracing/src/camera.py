@@ -1,7 +1,11 @@
 # world is right-handed, z is up
 import math
+import random
+
+import numpy as np
 
 from .ray import Ray
+from .vector3d import Vector3D, vec_to_np
 
 class Camera:
     def __init__(self, eye, look_at, up, fov, img_width, img_height):
@@ -12,6 +16,8 @@ class Camera:
         # self.aspect_ratio = aspect_ratio
         self.img_width = img_width
         self.img_height = img_height
+        # recursion depth given to primary rays (Ray's default)
+        self.ray_depth = 3
 
         aspect_ratio = img_height / img_width
 
@@ -36,4 +42,73 @@ class Camera:
     def ray(self, x, y):
         point_world = self.point_image2world(x, y)
         direction = (point_world - self.eye).normalize()
-        return Ray(self.eye, direction)
\ No newline at end of file
+        return Ray(self.eye, direction)
+
+    def pixel_directions(self, xs, ys):
+        # unit directions (N x 3) through image coordinates xs, ys
+        xs = np.asarray(xs, dtype=float).reshape(-1)
+        ys = np.asarray(ys, dtype=float).reshape(-1)
+        x_ndc = self.su * xs / self.img_width - self.su / 2
+        y_ndc = self.sv * ys / self.img_height - self.sv / 2
+        directions = (x_ndc[:, None] * vec_to_np(self.u)
+                      + y_ndc[:, None] * vec_to_np(self.v)
+                      - vec_to_np(self.w))
+        return directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+    def rays(self, xs, ys, lens_samples=None):
+        # batched version of ray(): structure-of-arrays origins and directions (N x 3)
+        directions = self.pixel_directions(xs, ys)
+        origins = np.broadcast_to(vec_to_np(self.eye), directions.shape).copy()
+        return origins, directions
+
+def concentric_disk(samples):
+    # Shirley-Chiu mapping from [0, 1)^2 to the unit disk, no rejection loop
+    a = 2.0 * samples[:, 0] - 1.0
+    b = 2.0 * samples[:, 1] - 1.0
+    use_a = np.abs(a) > np.abs(b)
+    r = np.where(use_a, a, b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        phi = np.where(use_a, (math.pi / 4) * (b / a), (math.pi / 2) - (math.pi / 4) * (a / b))
+    phi = np.where(r == 0, 0.0, phi)
+    return np.stack([r * np.cos(phi), r * np.sin(phi)], axis=1)
+
+class CameraDoF(Camera):
+    def __init__(self, eye, look_at, up, fov, img_width, img_height, lens_radius, focal_distance, ray_depth=3):
+        super().__init__(eye, look_at, up, fov, img_width, img_height)
+        self.lens_radius = lens_radius
+        self.focal_distance = focal_distance
+        self.ray_depth = ray_depth
+
+    def _random_in_unit_disk(self):
+        while True:
+            p = Vector3D(random.uniform(-1, 1), random.uniform(-1, 1), 0)
+            if p.dot(p) < 1.0:
+                return p
+
+    def ray(self, x, y):
+        x_ndc = self.su * (x / self.img_width - 0.5)
+        y_ndc = self.sv * (y / self.img_height - 0.5)
+
+        pixel_dir = (self.u * x_ndc + self.v * y_ndc - self.w).normalize()
+
+        focal_point = self.eye + (pixel_dir * self.focal_distance)
+
+        sample = self._random_in_unit_disk() * self.lens_radius
+        offset = self.u * sample.x + self.v * sample.y
+        new_origin = self.eye + offset
+
+        return Ray(new_origin, (focal_point - new_origin).normalize(), self.ray_depth)
+
+    def rays(self, xs, ys, lens_samples=None):
+        # thin lens: every ray passes through its pixel's point on the focal plane
+        pixel_dirs = self.pixel_directions(xs, ys)
+        if lens_samples is None:
+            lens_samples = np.random.random((len(pixel_dirs), 2))
+        disk = concentric_disk(np.asarray(lens_samples, dtype=float)) * self.lens_radius
+
+        eye = vec_to_np(self.eye)
+        focal_points = eye + pixel_dirs * self.focal_distance
+        origins = eye + disk[:, :1] * vec_to_np(self.u) + disk[:, 1:] * vec_to_np(self.v)
+        directions = focal_points - origins
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        return origins, directions
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+
+class Checkpoint:
+    # per-pixel accumulation buffer memory-mapped to a .npy file of shape (H, W, 7):
+    #   [0:3] sum of the samples, [3:6] sum of their squares, [6] sample count
+    # sums (unlike means) add up, so independent runs merge by plain addition.
+    # The seeds of the runs are kept next to it (see read_seeds): two runs with
+    # the same seed draw the same samples, and merging them counts those twice
+    CHANNELS = 7
+
+    def __init__(self, path, img_width, img_height, seed=None):
+        self.path = path
+        shape = (img_height, img_width, self.CHANNELS)
+        self.seeds = list()
+        if os.path.exists(path):
+            self.data = np.load(path, mmap_mode='r+')
+            if self.data.shape != shape:
+                raise ValueError(f"checkpoint {path} has shape {self.data.shape}, expected {shape}")
+            self.seeds = read_seeds(path)
+        else:
+            self.data = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=shape)
+        if seed is not None and seed not in self.seeds:
+            self.seeds.append(seed)
+        write_seeds(path, self.seeds)
+
+    @property
+    def count(self):
+        return self.data[:, :, 6]
+
+    def tile_done(self, tile):
+        i0, i1, j0, j1 = tile
+        return bool((self.data[i0:i1, j0:j1, 6] > 0).all())
+
+    def store_tile(self, tile, mean, variance, count):
+        # converts the framebuffer statistics of a finished tile and flushes it to disk
+        i0, i1, j0, j1 = tile
+        self.data[i0:i1, j0:j1] = to_sums(mean, variance, count)
+        self.data.flush()
+
+    def load_into(self, fb):
+        mean, variance, count = from_sums(self.data)
+        fb.rgb[:] = mean
+        fb.variance[:] = variance
+        fb.count[:] = count
+
+    def close(self):
+        self.data.flush()
+        self.data = None
+
+def to_sums(mean, variance, count):
+    count = np.asarray(count, dtype=np.float64)[..., None]
+    sums = np.empty(mean.shape[:-1] + (Checkpoint.CHANNELS,))
+    sums[..., 0:3] = mean * count
+    # variance is the unbiased sample variance
+    sums[..., 3:6] = variance * np.maximum(count - 1, 0) + count * mean**2
+    sums[..., 6] = count[..., 0]
+    return sums
+
+def from_sums(sums):
+    count = sums[..., 6]
+    n = np.maximum(count, 1)[..., None]
+    mean = sums[..., 0:3] / n
+    variance = (sums[..., 3:6] - n * mean**2) / np.maximum(n - 1, 1)
+    variance = np.where(count[..., None] > 1, np.maximum(variance, 0), 0)
+    return mean, variance, count
+
+def seeds_path(path):
+    return path + '.seeds'
+
+def read_seeds(path):
+    # seeds of the runs summed in the checkpoint at path, one per line;
+    # unseeded runs leave none
+    if not os.path.exists(seeds_path(path)):
+        return list()
+    with open(seeds_path(path)) as f:
+        return [int(line) for line in f if line.strip()]
+
+def write_seeds(path, seeds):
+    with open(seeds_path(path), 'w') as f:
+        f.writelines(f"{seed}\n" for seed in seeds)
+
+def merge_checkpoints(paths):
+    # sum of the accumulation buffers of independent runs (different --seed)
+    # and the seeds they were rendered with
+    total = None
+    seeds = dict()
+    for path in paths:
+        for seed in read_seeds(path):
+            if seed in seeds:
+                raise ValueError(f"checkpoints {seeds[seed]} and {path} were both rendered with seed {seed}, "
+                                 "their samples are the same and would be counted twice")
+            seeds[seed] = path
+        data = np.load(path, mmap_mode='r')
+        if total is None:
+            total = np.array(data, dtype=np.float64)
+        elif data.shape != total.shape:
+            raise ValueError(f"checkpoint {path} has shape {data.shape}, expected {total.shape}")
+        else:
+            total += data
+    return total, list(seeds)
@@ -0,0 +1,52 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+class FrameBuffer:
+    # float32 planes living in one shared memory block, so pool workers write
+    # their tiles in place and the parent only reads:
+    #   rgb      (H, W, 3) mean color of the samples taken so far
+    #   count    (H, W)    number of samples
+    #   variance (H, W, 3) sample variance of each channel
+    PLANES = (("rgb", 3), ("count", 1), ("variance", 3))
+
+    def __init__(self, img_width, img_height, name=None):
+        self.img_width = img_width
+        self.img_height = img_height
+        channels = sum(c for _, c in self.PLANES)
+        size = img_width * img_height * channels * np.dtype(np.float32).itemsize
+
+        # without a name a new block is created, otherwise we attach to it
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        data = np.ndarray((img_height, img_width, channels), dtype=np.float32, buffer=self.shm.buf)
+        if self.owner:
+            data[:] = 0
+        offset = 0
+        for plane, c in self.PLANES:
+            view = data[:, :, offset:offset + c]
+            setattr(self, plane, view[:, :, 0] if c == 1 else view)
+            offset += c
+        self._data = data
+
+    def write_tile(self, tile, rgb, count, variance):
+        i0, i1, j0, j1 = tile
+        self.rgb[i0:i1, j0:j1] = rgb
+        self.count[i0:i1, j0:j1] = count
+        self.variance[i0:i1, j0:j1] = variance
+
+    def snapshot(self):
+        # copy of the current image, safe to use while workers keep writing
+        return np.clip(self.rgb, 0, 1).astype(np.float64)
+
+    def close(self):
+        # numpy views must go before the buffer can be released
+        self.rgb = self.count = self.variance = self._data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
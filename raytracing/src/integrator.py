@@ -0,0 +1,45 @@
+import random
+
+from .base import Color
+
+# Iterative (wavefront) evaluation of reflections and refractions.
+# Instead of material.shade() recursing into scene.hit() at every bounce, the
+# rays of one bounce depth form a wave: the whole wave is intersected at once,
+# every hit is shaded by its material's scatter(), which returns the local color
+# and the secondary rays with their weights, and those rays are the next wave.
+# Each ray carries the product of the weights along its path (throughput), so
+# the recursion depth only bounds the number of waves, never the call stack.
+# Paths whose throughput drops below scene.roulette_threshold play Russian
+# roulette: they survive with probability throughput / threshold and carry the
+# threshold as their weight from then on, so the image stays unbiased while
+# paths that barely contribute stop early.
+
+def trace(scene, rays):
+    # color seen along each ray, one Color per ray
+    return shade_hits(scene, scene.hit_wave(rays))
+
+def shade_hits(scene, hits):
+    # color of each hit record (or MISS) including everything reflected/refracted
+    colors = [Color(0, 0, 0) for _ in hits]
+    threshold = scene.roulette_threshold
+    wave = [(k, 1.0) for k in range(len(hits))]
+    while wave:
+        rays, next_wave = list(), list()
+        for (k, weight), hit_rec in zip(wave, hits):
+            if not hit_rec.hit:
+                colors[k].iadd_scaled(scene.background, weight)
+                continue
+            color, secondary = hit_rec.material.scatter(hit_rec, scene)
+            colors[k].iadd_scaled(color, weight)
+            for ray, ray_weight in secondary:
+                throughput = weight * ray_weight
+                if throughput < threshold:
+                    if random.random() * threshold >= throughput:
+                        continue
+                    throughput = threshold
+                rays.append(ray)
+                next_wave.append((k, throughput))
+        wave = next_wave
+        if wave:
+            hits = scene.hit_wave(rays)
+    return colors
@@ -0,0 +1,167 @@
+import numpy as np
+
+# Interval arithmetic (Moore 1966) for the implicit surfaces: an Interval holds
+# arrays lo <= hi and every operation returns an interval containing all the
+# values the operation takes over its operands, so a function evaluated on the
+# intervals of x, y and z over a region bounds it over the whole region; where
+# the bound excludes 0 the region holds no point of the surface.
+# function() code runs unchanged on Intervals: the Python operators are
+# overloaded and the numpy functions (np.sin, np.minimum, ...) reach
+# __array_ufunc__. Supported: + - * / ** (constant exponent), abs, min, max,
+# sqrt, sin, cos, atan2. No outward rounding: bounds may be off by an ulp,
+# far below the tolerance of the root finder.
+
+TwoPi = 2 * np.pi
+
+class Interval:
+    __slots__ = ("lo", "hi")
+
+    def __init__(self, lo, hi=None):
+        self.lo = np.asarray(lo, dtype=float)
+        self.hi = self.lo if hi is None else np.asarray(hi, dtype=float)
+
+    def contains_zero(self):
+        return (self.lo <= 0) & (self.hi >= 0)
+
+    def __add__(self, other):
+        return interval_add(self, as_interval(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return interval_subtract(self, as_interval(other))
+
+    def __rsub__(self, other):
+        return interval_subtract(as_interval(other), self)
+
+    def __mul__(self, other):
+        return interval_multiply(self, as_interval(other))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return interval_divide(self, as_interval(other))
+
+    def __rtruediv__(self, other):
+        return interval_divide(as_interval(other), self)
+
+    def __pow__(self, exponent):
+        return interval_power(self, exponent)
+
+    def __neg__(self):
+        return Interval(-self.hi, -self.lo)
+
+    def __abs__(self):
+        return interval_absolute(self)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        operation = IntervalUfuncs.get(ufunc)
+        if method != '__call__' or kwargs or operation is None:
+            return NotImplemented
+        if ufunc is np.power:
+            return interval_power(as_interval(inputs[0]), inputs[1])
+        return operation(*(as_interval(value) for value in inputs))
+
+def as_interval(value):
+    return value if isinstance(value, Interval) else Interval(value)
+
+def interval_add(a, b):
+    return Interval(a.lo + b.lo, a.hi + b.hi)
+
+def interval_subtract(a, b):
+    return Interval(a.lo - b.hi, a.hi - b.lo)
+
+def interval_multiply(a, b):
+    p1, p2, p3, p4 = a.lo * b.lo, a.lo * b.hi, a.hi * b.lo, a.hi * b.hi
+    return Interval(np.minimum(np.minimum(p1, p2), np.minimum(p3, p4)),
+                    np.maximum(np.maximum(p1, p2), np.maximum(p3, p4)))
+
+def interval_divide(a, b):
+    # a divisor that may be 0 bounds nothing
+    zero = b.contains_zero()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = interval_multiply(a, Interval(1.0 / b.hi, 1.0 / b.lo))
+    return Interval(np.where(zero, -np.inf, result.lo), np.where(zero, np.inf, result.hi))
+
+def interval_power(a, exponent):
+    if isinstance(exponent, Interval):
+        raise TypeError("interval exponents are not supported")
+    n = float(exponent)
+    if n.is_integer() and n < 0:
+        return interval_divide(Interval(1.0), interval_power(a, -n))
+    if n.is_integer():
+        n = int(n)
+        lo_n, hi_n = integer_power(a.lo, n), integer_power(a.hi, n)
+        if n % 2 == 0:
+            # even powers: the minimum is 0 when the interval holds it
+            low = np.where(a.contains_zero(), 0.0, np.minimum(lo_n, hi_n))
+            return Interval(low, np.maximum(lo_n, hi_n))
+        return Interval(lo_n, hi_n)
+    # fractional powers are only defined for x >= 0, where they are monotone
+    return Interval(np.maximum(a.lo, 0) ** n, np.maximum(a.hi, 0) ** n)
+
+def integer_power(x, n):
+    # x ** n by squaring: numpy sends x ** 3 and up to pow(), far slower
+    result = None
+    while n:
+        if n & 1:
+            result = x if result is None else result * x
+        n >>= 1
+        if n:
+            x = x * x
+    return np.ones_like(x) if result is None else result
+
+def interval_absolute(a):
+    low = np.where(a.lo >= 0, a.lo, np.where(a.hi <= 0, -a.hi, 0.0))
+    return Interval(low, np.maximum(np.abs(a.lo), np.abs(a.hi)))
+
+def interval_minimum(a, b):
+    return Interval(np.minimum(a.lo, b.lo), np.minimum(a.hi, b.hi))
+
+def interval_maximum(a, b):
+    return Interval(np.maximum(a.lo, b.lo), np.maximum(a.hi, b.hi))
+
+def interval_sqrt(a):
+    return Interval(np.sqrt(np.maximum(a.lo, 0)), np.sqrt(np.maximum(a.hi, 0)))
+
+def holds_angle(a, angle):
+    # does a hold angle + 2 k pi for some integer k?
+    k = np.ceil((a.lo - angle) / TwoPi)
+    return angle + k * TwoPi <= a.hi
+
+def interval_sin(a):
+    s_lo, s_hi = np.sin(a.lo), np.sin(a.hi)
+    low = np.where(holds_angle(a, -0.5 * np.pi), -1.0, np.minimum(s_lo, s_hi))
+    high = np.where(holds_angle(a, 0.5 * np.pi), 1.0, np.maximum(s_lo, s_hi))
+    return Interval(low, high)
+
+def interval_cos(a):
+    c_lo, c_hi = np.cos(a.lo), np.cos(a.hi)
+    low = np.where(holds_angle(a, np.pi), -1.0, np.minimum(c_lo, c_hi))
+    high = np.where(holds_angle(a, 0.0), 1.0, np.maximum(c_lo, c_hi))
+    return Interval(low, high)
+
+def interval_arctan2(y, x):
+    # the angles of a box away from the origin and from the cut along the
+    # negative x axis form an arc whose ends are corners of the box
+    corners = [np.arctan2(yv, xv) for yv in (y.lo, y.hi) for xv in (x.lo, x.hi)]
+    low = np.minimum(np.minimum(corners[0], corners[1]), np.minimum(corners[2], corners[3]))
+    high = np.maximum(np.maximum(corners[0], corners[1]), np.maximum(corners[2], corners[3]))
+    cut = (x.lo <= 0) & (y.lo <= 0) & (y.hi >= 0)
+    return Interval(np.where(cut, -np.pi, low), np.where(cut, np.pi, high))
+
+IntervalUfuncs = {
+    np.add: interval_add,
+    np.subtract: interval_subtract,
+    np.multiply: interval_multiply,
+    np.true_divide: interval_divide,
+    np.power: interval_power,
+    np.negative: lambda a: -a,
+    np.absolute: interval_absolute,
+    np.minimum: interval_minimum,
+    np.maximum: interval_maximum,
+    np.sqrt: interval_sqrt,
+    np.sin: interval_sin,
+    np.cos: interval_cos,
+    np.arctan2: interval_arctan2,
+}
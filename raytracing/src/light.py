@@ -1,24 +1,38 @@
-from random import uniform
+import math
+from random import random, uniform
+
+import numpy as np
+
 from .vector3d import Vector3D
 from .base import Color
+from .shadowmap import CubeShadowMap
 
 class Light:
     def __init__(self):
         pass
 
-    def position(self):
+    def position(self, sample=None):
         raise NotImplementedError("Subclasses should implement this method")
 class PointLight:
-    def __init__(self, position: Vector3D, color: Color, intensity: float = 1.0):
+    # a single point: one shadow ray is always enough
+    num_samples = 1
+
+    def __init__(self, position: Vector3D, color: Color, intensity: float = 1.0, shadow_map: int = 0, shadow_bias: float = 1.5, shadow_pcf: int = 1):
         self.pos = position  # position is a Vector3
         self.color = color  # color is a Color
         self.intensity = intensity  # intensity is a float
+        self.set_shadow_map(shadow_map, shadow_bias, shadow_pcf)
 
-    def position(self):
+    def set_shadow_map(self, resolution, bias=1.5, pcf=1):
+        # shadows from a cube depth map of resolution^2 texels per face, for
+        # static scenes; resolution 0 keeps the exact shadow rays
+        self.shadow_map = CubeShadowMap(self.pos, resolution, bias, pcf) if resolution else None
+
+    def position(self, sample=None):
         return self.pos
 
 class AreaLight:
-    def __init__(self, position, look_at, up, width, height, color=Color(1, 1, 1), intensity=1.0):
+    def __init__(self, position, look_at, up, width, height, color=Color(1, 1, 1), intensity=1.0, grid=1, adaptive_shadows=False):
         self.pos = position
         self.color = color
         self.intensity = intensity
@@ -28,13 +42,83 @@ class AreaLight:
         up = up.normalize()
         self.u = up.cross(self.w).normalize()
         self.v = self.w.cross(self.u).normalize()
+        self.set_grid(grid)
+        # test the corner cells first and the rest only in the penumbra
+        self.adaptive_shadows = adaptive_shadows
+        # shadow rays of the sampled (grid > 1) shading, cast and skipped
+        self.shadow_rays = 0
+        self.shadow_rays_saved = 0
+
+    def set_grid(self, grid):
+        # shading takes grid x grid stratified samples of the light per hit
+        self.grid = grid
+        self.num_samples = grid * grid
+        cells = np.arange(self.num_samples)
+        self.cells = np.stack([cells // grid, cells % grid], axis=1).astype(float)
+        # the corner cells probe the visibility of the light, see sampled_visibility()
+        corners = sorted({0, grid - 1, grid * (grid - 1), grid * grid - 1})
+        self.probes = np.array(corners)
+        self.others = np.setdiff1d(cells, self.probes)
 
-    def position(self):
+    def position(self, sample=None):
+        # sample is a point (u, v) of [0, 1)^2 from the sampler, random if None
         # from image coordinates to coordinates 
         # in the camera's view plane
-        u, v = uniform(0, 1), uniform(0, 1)
+        u, v = sample if sample is not None else (uniform(0, 1), uniform(0, 1))
         x = self.su * u - self.su / 2
         y = self.sv * v - self.sv / 2
 
         # from view plane to world coordinates
-        return self.pos + self.u * x + self.v * y
\ No newline at end of file
+        return self.pos + self.u * x + self.v * y
+
+    def sample_points(self, sample=None):
+        # num_samples points (num_samples x 3), one in each cell of the grid x grid
+        # subdivision of the light; the sampler's point shifts all the cells
+        # alike, without it each cell is jittered on its own
+        if sample is None:
+            jitter = np.random.random((self.num_samples, 2))
+        else:
+            jitter = np.asarray(sample)
+        uv = (self.cells + jitter) / self.grid
+        # rows (1, x, y) times the rows (pos, u, v)
+        coords = np.empty((self.num_samples, 3))
+        coords[:, 0] = 1.0
+        coords[:, 1] = self.su * uv[:, 0] - self.su / 2
+        coords[:, 2] = self.sv * uv[:, 1] - self.sv / 2
+        basis = np.array([[p.x, p.y, p.z] for p in (self.pos, self.u, self.v)])
+        return coords @ basis
+
+# every light keeps this fraction of its importance below the horizon of the
+# shading point: the specular term of this shading model does not vanish
+# there, and a light with probability 0 would bias the estimate
+ImportanceFloor = 0.1
+
+class LightSelector:
+    # Picks the lights a shading point samples, with probability proportional
+    # to a cheap estimate of their contribution: power / distance^2 times a
+    # bound of the cosine at the point (the extent of an area light widens it).
+    # Each of the k draws is weighted by 1 / (k p), so the average over draws
+    # is an unbiased estimate of the sum over all the lights.
+    def __init__(self, lights):
+        self.centers = np.array([[light.pos.x, light.pos.y, light.pos.z] for light in lights])
+        self.power = np.array([light.intensity * (light.color.r + light.color.g + light.color.b) / 3
+                               for light in lights])
+        # radius of the sphere around each light, 0 for a point
+        self.radius = np.array([0.5 * math.hypot(light.su, light.sv) if hasattr(light, 'su') else 0.0
+                                for light in lights])
+
+    def draw(self, point, normal, k):
+        # k (index, weight) pairs, drawn with replacement
+        vectors = self.centers - (point.x, point.y, point.z)
+        dist2 = np.maximum(np.einsum('ij,ij->i', vectors, vectors), self.radius ** 2 + 1e-12)
+        dist = np.sqrt(dist2)
+        cos_bound = np.minimum(vectors @ (normal.x, normal.y, normal.z) / dist + self.radius / dist, 1.0)
+        importance = self.power * (np.maximum(cos_bound, 0.0) + ImportanceFloor) / dist2
+        total = importance.sum()
+        if total <= 0:
+            importance = np.ones(len(importance))
+            total = float(len(importance))
+        cdf = np.cumsum(importance)
+        picks = np.searchsorted(cdf, [random() * total for _ in range(k)], side='right')
+        picks = np.minimum(picks, len(cdf) - 1).tolist()
+        return [(index, total / (k * importance[index])) for index in picks]
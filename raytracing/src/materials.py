@@ -1,8 +1,50 @@
 import math
 
+import numpy as np
+
 from .base import Color, CastEpsilon, Material
+from .integrator import shade_hits
 from .ray import Ray
-from .vector3d import Vector3D
+from .vector3d import Vector3D, vec_to_np
+
+def light_sample(ray, index):
+    # the sampler's point on light `index` for this path, None lets the light draw one
+    if ray is None or ray.samples is None:
+        return None
+    return ray.samples[2 * index], ray.samples[2 * index + 1]
+
+def light_visibility(scene, light, hit_record, shadow_origin, light_dir, light_distance):
+    # how much of a single-point light reaches the hit: a lookup in the light's
+    # shadow map when it has one, otherwise an exact shadow ray
+    shadow_map = getattr(light, 'shadow_map', None)
+    if shadow_map is None:
+        return 0.0 if scene.occluded(shadow_origin, light_dir, light_distance, light) else 1.0
+    if shadow_map.depth is None:
+        shadow_map.build(scene)
+    return shadow_map.visibility(hit_record.point, hit_record.normal)
+
+def sampled_visibility(scene, light, origins, light_dirs, light_distances):
+    # which of the light's sample points are visible from the shading point.
+    # With light.adaptive_shadows the corner cells are tested first: when they
+    # agree the point is taken as fully lit or fully shadowed and the other
+    # shadow rays are skipped, only penumbra points pay for all of them
+    # (an occluder smaller than the light, seen only by inner cells, is missed)
+    n = len(light_dirs)
+    if not light.adaptive_shadows or len(light.probes) == n:
+        light.shadow_rays += n
+        return ~scene.occluded_batch(origins, light_dirs, light_distances)
+
+    probes, others = light.probes, light.others
+    blocked = np.empty(n, dtype=bool)
+    blocked[probes] = scene.occluded_batch(origins[probes], light_dirs[probes], light_distances[probes])
+    if blocked[probes].all() or not blocked[probes].any():
+        blocked[others] = blocked[probes[0]]
+        light.shadow_rays += len(probes)
+        light.shadow_rays_saved += len(others)
+    else:
+        blocked[others] = scene.occluded_batch(origins[others], light_dirs[others], light_distances[others])
+        light.shadow_rays += n
+    return ~blocked
 
 class ColorMaterial(Material):
     def __init__(self,
@@ -35,25 +77,67 @@ class SimpleMaterial(Material):
         shaded_color = Color(0, 0, 0)
         # Ambient component
         amb_color = scene.ambient_light * self.ambient_coefficient 
+        view_dir = (scene.camera.eye - hit_record.point).normalize_()
         for light in scene.lights:
-            light_vector = light.position() - hit_record.point
-
-            # Diffuse component
-            light_dir = light_vector.normalize()
-            diff_intensity = max(hit_record.normal.dot(light_dir), 0)
-            diff_color = (self.diffuse_color @ light.color) * (self.diffuse_coefficient * diff_intensity)
-
-            # Specular component
-            view_dir = (scene.camera.eye - hit_record.point).normalize()
-            reflect_dir = (hit_record.normal * 2 * hit_record.normal.dot(light_dir) - light_dir).normalize()
-            spec_intensity = max(view_dir.dot(reflect_dir), 0) ** self.specular_shininess
-            spec_color = (self.specular_color @ light.color) * self.specular_coefficient * spec_intensity
-
+            shaded_color.iadd_scaled(amb_color, light.intensity)
+        for index, weight in scene.select_lights(hit_record.point, hit_record.normal):
             # Accumulate color contributions
-            shaded_color += (amb_color + diff_color + spec_color) * light.intensity
+            light = scene.lights[index]
+            self.add_direct_light(shaded_color, hit_record.normal, view_dir,
+                                  (light.position(light_sample(hit_record.ray, index)) - hit_record.point).normalize_(),
+                                  light, self.diffuse_color, weight)
 
         return shaded_color
 
+    def add_direct_light(self, shaded_color, normal, view_dir, light_dir, light, diffuse_color, visibility=1.0):
+        # adds the diffuse and specular terms of one light in place,
+        # visibility is the unoccluded fraction of it
+        intensity = light.intensity * visibility
+        n_dot_l = normal.dot(light_dir)
+
+        # Diffuse component
+        diff_intensity = max(n_dot_l, 0)
+        shaded_color.iadd_product(diffuse_color, light.color,
+                                  self.diffuse_coefficient * diff_intensity * intensity)
+
+        # Specular component, reflect_dir = 2 (n.l) n - l
+        if self.specular_coefficient:
+            k = 2 * n_dot_l
+            spec_cos = (view_dir.x * (normal.x * k - light_dir.x)
+                        + view_dir.y * (normal.y * k - light_dir.y)
+                        + view_dir.z * (normal.z * k - light_dir.z))
+            spec_intensity = max(spec_cos, 0) ** self.specular_shininess
+            shaded_color.iadd_product(self.specular_color, light.color,
+                                      self.specular_coefficient * spec_intensity * intensity)
+
+    def add_sampled_light(self, shaded_color, hit_record, view_dir, shadow_origin, light, sample, diffuse_color, scene, weight=1.0):
+        # average of add_direct_light over light.num_samples stratified points
+        # of an area light, with the shadow rays in batched queries
+        points = light.sample_points(sample)
+        light_vectors = points - vec_to_np(hit_record.point)
+        light_distances = np.linalg.norm(light_vectors, axis=1)
+        light_dirs = light_vectors / light_distances[:, None]
+        origins = np.repeat(vec_to_np(shadow_origin)[None, :], len(points), axis=0)
+        lit = sampled_visibility(scene, light, origins, light_dirs, light_distances)
+        if not lit.any():
+            return
+
+        normal = vec_to_np(hit_record.normal)
+        n_dot_l = light_dirs[lit] @ normal
+        weight = light.intensity / light.num_samples * weight
+
+        # Diffuse component
+        shaded_color.iadd_product(diffuse_color, light.color,
+                                  self.diffuse_coefficient * np.maximum(n_dot_l, 0).sum() * weight)
+
+        # Specular component, reflect_dir = 2 (n.l) n - l
+        if self.specular_coefficient:
+            reflect_dirs = 2 * n_dot_l[:, None] * normal - light_dirs[lit]
+            spec_cos = reflect_dirs @ vec_to_np(view_dir)
+            spec_intensity = (np.maximum(spec_cos, 0) ** self.specular_shininess).sum()
+            shaded_color.iadd_product(self.specular_color, light.color,
+                                      self.specular_coefficient * spec_intensity * weight)
+
 class SimpleMaterialWithShadows(SimpleMaterial):
     def __init__(self, ambient_coefficient: float, diffuse_coefficient: float, diffuse_color: Color, specular_coefficient: float, specular_color: Color, specular_shininess: float = 32):
         super().__init__(ambient_coefficient, diffuse_coefficient, diffuse_color, specular_coefficient, specular_color, specular_shininess)
@@ -62,31 +146,30 @@ class SimpleMaterialWithShadows(SimpleMaterial):
         shaded_color = Color(0, 0, 0)
         # Ambient component
         amb_color = scene.ambient_light * self.ambient_coefficient 
+        view_dir = (scene.camera.eye - hit_record.point).normalize_()
+        shadow_origin = hit_record.point + hit_record.normal * CastEpsilon
         for light in scene.lights:
-            light_vector = light.position() - hit_record.point
-
             # add ambient component once
-            shaded_color += amb_color * light.intensity
-
-            # Shadow check
-            shadow_ray = Ray(hit_record.point + hit_record.normal * CastEpsilon, light_vector.normalize())
-            shadow_hit = scene.hit(shadow_ray)
-            if shadow_hit.hit and shadow_hit.t < light_vector.length():
+            shaded_color.iadd_scaled(amb_color, light.intensity)
+
+        for index, weight in scene.select_lights(hit_record.point, hit_record.normal):
+            light = scene.lights[index]
+            if light.num_samples > 1:
+                self.add_sampled_light(shaded_color, hit_record, view_dir, shadow_origin, light,
+                                       light_sample(hit_record.ray, index), self.diffuse_color, scene, weight)
+                continue
+
+            light_vector = light.position(light_sample(hit_record.ray, index)) - hit_record.point
+            light_distance = light_vector.length()
+            light_dir = light_vector.normalize_()
+
+            # Shadow check, a shadow map lookup or any blocker between the point and the light
+            visibility = light_visibility(scene, light, hit_record, shadow_origin, light_dir, light_distance)
+            if not visibility:
                 continue  # In shadow, skip this light
 
-            # Diffuse component
-            light_dir = light_vector.normalize()
-            diff_intensity = max(hit_record.normal.dot(light_dir), 0)
-            diff_color = (self.diffuse_color @ light.color) * (self.diffuse_coefficient * diff_intensity)
-
-            # Specular component
-            view_dir = (scene.camera.eye - hit_record.point).normalize()
-            reflect_dir = (hit_record.normal * 2 * hit_record.normal.dot(light_dir) - light_dir).normalize()
-            spec_intensity = max(view_dir.dot(reflect_dir), 0) ** self.specular_shininess
-            spec_color = (self.specular_color @ light.color) * self.specular_coefficient * spec_intensity
-
             # Accumulate color contributions
-            shaded_color += (diff_color + spec_color) * light.intensity
+            self.add_direct_light(shaded_color, hit_record.normal, view_dir, light_dir, light, self.diffuse_color, visibility * weight)
 
         return shaded_color
 
@@ -101,32 +184,41 @@ class CheckerboardMaterial(SimpleMaterial):
         shaded_color = Color(0, 0, 0)
         # Ambient component
         amb_color = scene.ambient_light * self.ambient_coefficient 
-        for light in scene.lights:
-            light_vector = light.position() - hit_record.point
-
-            # add ambient component once
-            shaded_color += amb_color * light.intensity
+        shadow_origin = hit_record.point + hit_record.normal * CastEpsilon
 
-            # Shadow check
-            shadow_ray = Ray(hit_record.point + hit_record.normal * CastEpsilon, light_vector.normalize())
-            shadow_hit = scene.hit(shadow_ray)
-            if shadow_hit.hit and shadow_hit.t < light_vector.length():
-                continue  # In shadow, skip this light
+        # Diffuse component from checkerboard pattern
+        u = hit_record.uv.x / self.square_size
+        v = hit_record.uv.y / self.square_size
 
-            # Diffuse component from checkerboard pattern
-            u = hit_record.uv.x / self.square_size
-            v = hit_record.uv.y / self.square_size
+        diffuse_color = self.black_color  # black
+        if (int(math.floor(u)) + int(math.floor(v))) % 2 == 0:
+            diffuse_color = self.white_color  # white
 
-            diffuse_color = self.black_color  # black
-            if (int(math.floor(u)) + int(math.floor(v))) % 2 == 0:
-                diffuse_color = self.white_color  # white
+        for light in scene.lights:
+            # add ambient component once
+            shaded_color.iadd_scaled(amb_color, light.intensity)
+
+        for index, weight in scene.select_lights(hit_record.point, hit_record.normal):
+            light = scene.lights[index]
+            if light.num_samples > 1:
+                # no specular term, the view direction is not needed
+                self.add_sampled_light(shaded_color, hit_record, None, shadow_origin, light,
+                                       light_sample(hit_record.ray, index), diffuse_color, scene, weight)
+                continue
+
+            light_vector = light.position(light_sample(hit_record.ray, index)) - hit_record.point
+            light_distance = light_vector.length()
+            light_dir = light_vector.normalize_()
+
+            # Shadow check, a shadow map lookup or any blocker between the point and the light
+            visibility = light_visibility(scene, light, hit_record, shadow_origin, light_dir, light_distance)
+            if not visibility:
+                continue  # In shadow, skip this light
 
-            light_dir = light_vector.normalize()
+            # Accumulate color contributions (no specular term)
             diff_intensity = max(hit_record.normal.dot(light_dir), 0)
-            diff_color = (diffuse_color @ light.color) * (self.diffuse_coefficient * diff_intensity)
-
-            # Accumulate color contributions
-            shaded_color += diff_color * light.intensity
+            shaded_color.iadd_product(diffuse_color, light.color,
+                                      self.diffuse_coefficient * diff_intensity * light.intensity * visibility * weight)
 
         return shaded_color
 
@@ -137,10 +229,13 @@ class TranslucidMaterial(SimpleMaterial):
         self.refraction_index = refraction_index
 
     def shade(self, hit_record, scene):
+        return shade_hits(scene, [hit_record])[0]
+
+    def scatter(self, hit_record, scene):
         # Ambient component
         shaded_color = scene.ambient_light * self.ambient_coefficient 
         origin = hit_record.ray.origin
-        view_dir = (origin - hit_record.point).normalize()
+        view_dir = (origin - hit_record.point).normalize_()
 
         # we assume that outside the object is air with refraction index = 1.0
         # this is a simplification. A more complete implementation would track
@@ -158,38 +253,23 @@ class TranslucidMaterial(SimpleMaterial):
             # we also need to flip c so refraction calculations work correctly
             c = -c
 
-        for light in scene.lights:
-            light_vector = light.position() - hit_record.point
-            # # Diffuse component
-            light_dir = light_vector.normalize()
-            diff_intensity = max(n.dot(light_dir), 0)
-            shaded_color += (self.diffuse_color @ light.color) * (self.diffuse_coefficient * diff_intensity)*light.intensity
-
-            # # Specular component
-            reflect_dir = (n * 2 * n.dot(light_dir) - light_dir).normalize()
-            spec_intensity = max(view_dir.dot(reflect_dir), 0) ** self.specular_shininess
-            shaded_color += (self.specular_color @ light.color) * self.specular_coefficient * spec_intensity*light.intensity
-
-        transmitted_color = Color(1, 0, 0)
+        for index, weight in scene.select_lights(hit_record.point, n):
+            light = scene.lights[index]
+            light_dir = (light.position(light_sample(hit_record.ray, index)) - hit_record.point).normalize_()
+            # Diffuse and specular components
+            self.add_direct_light(shaded_color, n, view_dir, light_dir, light, self.diffuse_color, weight)
+
         if hit_record.ray.depth < scene.max_depth:
-            # transmission component
-            k = 1 - eta**2 * (1 - c**2)
-            if k >= 0: # if k < 0 total internal reflection occurs
-                refract_dir =  (-view_dir * eta  + n * (eta * c - math.sqrt(k))).normalize()
-                transmission_ray = Ray(hit_record.point, refract_dir, hit_record.ray.depth + 1)
-                transmission_hit = scene.hit(transmission_ray)
-                if transmission_hit.hit:
-                    transmission_material = transmission_hit.material
-                    transmitted_color = transmission_material.shade(transmission_hit, scene) * self.transmission_coefficient
-                else:
-                    transmitted_color = scene.background * self.transmission_coefficient
+            # transmission component, traced by the integrator
+            refract_dir = (-view_dir).refract(n, eta)
+            if refract_dir is not None: # None when total internal reflection occurs
+                transmission_ray = Ray(hit_record.point, refract_dir, hit_record.ray.depth + 1, hit_record.ray.samples)
+                return shaded_color, [(transmission_ray, self.transmission_coefficient)]
+            shaded_color.iadd(Color(1, 0, 0))
         else:
-            transmitted_color = Color(0, 1, 0)
-            
-            # Accumulate color contributions
-        shaded_color += transmitted_color
+            shaded_color.iadd(Color(0, 1, 0))
 
-        return shaded_color
+        return shaded_color, ()
     
 class MirrorMaterial(Material):
     def __init__(self, reflection_coefficient: float = 1.0):
@@ -197,31 +277,25 @@ class MirrorMaterial(Material):
         self.reflection_coefficient = reflection_coefficient
 
     def shade(self, hit_record, scene):
+        return shade_hits(scene, [hit_record])[0]
+
+    def scatter(self, hit_record, scene):
         if hit_record.ray.depth >= scene.max_depth:
-            return Color(0, 0, 0)
+            return Color(0, 0, 0), ()
 
         incident_dir = hit_record.ray.direction.normalize()
         normal = hit_record.normal.normalize()
 
-        cos_theta = incident_dir.dot(normal)
-        if cos_theta > 0:
-            normal = -normal
-            cos_theta = incident_dir.dot(normal)
+        if incident_dir.dot(normal) > 0:
+            normal.imul(-1)
 
-        reflect_dir = (incident_dir - normal * 2 * cos_theta).normalize()
+        reflect_dir = incident_dir.reflect(normal)
 
         reflection_ray = Ray(
             origin = hit_record.point + normal * CastEpsilon, 
             direction = reflect_dir, 
-            depth = hit_record.ray.depth + 1  
+            depth = hit_record.ray.depth + 1,
+            samples = hit_record.ray.samples
         )
 
-        reflection_hit = scene.hit(reflection_ray)
-        
-        if reflection_hit.hit:
-            reflection_material = reflection_hit.material
-            reflected_color = reflection_material.shade(reflection_hit, scene)
-        else:
-            reflected_color = scene.background
-
-        return reflected_color * self.reflection_coefficient
\ No newline at end of file
+        return Color(0, 0, 0), [(reflection_ray, self.reflection_coefficient)]
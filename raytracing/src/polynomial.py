@@ -0,0 +1,285 @@
+from math import comb
+
+import numpy as np
+
+# Polynomials in x, y, z as monomial coefficients {(i, j, k): c} for
+# c x^i y^j z^k. Like Interval and Dual, function() code runs unchanged on
+# Polynomials (+ - * and ** with a constant integer exponent), which is how
+# PolynomialSurface reads the coefficients of a surface off its function().
+# Along a ray p = o + d u the polynomial is one in u alone, and the first root
+# of that in a range is found exactly from its coefficients (first_roots)
+# instead of being bracketed by marching.
+
+class Polynomial:
+    __slots__ = ("terms",)
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    @staticmethod
+    def variables():
+        return (Polynomial({(1, 0, 0): 1.0}), Polynomial({(0, 1, 0): 1.0}), Polynomial({(0, 0, 1): 1.0}))
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        for exponents, c in as_polynomial(other).terms.items():
+            terms[exponents] = terms.get(exponents, 0.0) + c
+        return Polynomial(terms)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self + (-as_polynomial(other))
+
+    def __rsub__(self, other):
+        return as_polynomial(other) + (-self)
+
+    def __mul__(self, other):
+        terms = dict()
+        for (i1, j1, k1), c1 in self.terms.items():
+            for (i2, j2, k2), c2 in as_polynomial(other).terms.items():
+                exponents = (i1 + i2, j1 + j2, k1 + k2)
+                terms[exponents] = terms.get(exponents, 0.0) + c1 * c2
+        return Polynomial(terms)
+
+    __rmul__ = __mul__
+
+    def __pow__(self, exponent):
+        if int(exponent) != exponent or exponent < 0:
+            raise TypeError("polynomials only take non-negative integer powers")
+        result = Polynomial({(0, 0, 0): 1.0})
+        for _ in range(int(exponent)):
+            result = result * self
+        return result
+
+    def __neg__(self):
+        return Polynomial({exponents: -c for exponents, c in self.terms.items()})
+
+def as_polynomial(value):
+    return value if isinstance(value, Polynomial) else Polynomial({(0, 0, 0): float(value)})
+
+def polynomial_terms(function):
+    # monomial coefficients of function(x, y, z), zero terms dropped
+    terms = function(*Polynomial.variables()).terms
+    return {exponents: c for exponents, c in terms.items() if c != 0}
+
+def evaluate_terms(terms, x, y, z):
+    # the polynomial at floats, arrays, Intervals or Duals
+    total = 0.0
+    for (i, j, k), c in terms.items():
+        term = c
+        # x**0 is left out, an Interval holding 0 would bound it by [0, 1]
+        if i:
+            term = term * x**i
+        if j:
+            term = term * y**j
+        if k:
+            term = term * z**k
+        total = total + term
+    return total
+
+def derivative_terms(terms, axis):
+    # terms of the partial derivative along axis 0, 1 or 2
+    derivative = dict()
+    for exponents, c in terms.items():
+        if exponents[axis]:
+            lowered = list(exponents)
+            lowered[axis] -= 1
+            derivative[tuple(lowered)] = c * exponents[axis]
+    return derivative
+
+class RayRestriction:
+    # coefficients in u of f(o + d u), lowest power first. The monomial
+    # x^i y^j z^k expands into binomial products of o_a^(e - v) d_a^v, which
+    # all come out of a table of such products per axis; every term of the
+    # expansion multiplies one entry of each axis' table and adds into the
+    # coefficient of u^(v_x + v_y + v_z)
+    def __init__(self, terms):
+        self.degree = max(sum(exponents) for exponents in terms)
+        n = self.degree
+        # column of o^(e - v) d^v in the table of one axis
+        self.pairs = [(e - v, v) for e in range(n + 1) for v in range(e + 1)]
+        column = {pair: index for index, pair in enumerate(self.pairs)}
+        # (column x, column y, column z, power of u, weight) of every term
+        expansion = list()
+        for (i, j, k), c in terms.items():
+            for vx in range(i + 1):
+                for vy in range(j + 1):
+                    for vz in range(k + 1):
+                        weight = c * comb(i, vx) * comb(j, vy) * comb(k, vz)
+                        expansion.append((column[(i - vx, vx)], column[(j - vy, vy)],
+                                          column[(k - vz, vz)], vx + vy + vz, weight))
+        columns = np.array([term[:4] for term in expansion])
+        self.columns = columns[:, :3].T
+        # the matrix that sums the products of the terms into the coefficients
+        self.weights = np.zeros((len(expansion), n + 1))
+        self.weights[np.arange(len(expansion)), columns[:, 3]] = [term[4] for term in expansion]
+        self.o_exponents = np.array([pair[0] for pair in self.pairs])
+        self.d_exponents = np.array([pair[1] for pair in self.pairs])
+
+    def coefficients(self, origins, directions):
+        # N rays (N x 3 arrays) at once, an (N, degree + 1) array
+        both = powers(np.concatenate([origins, directions], axis=1), self.degree)
+        o_powers, d_powers = both[:, :3], both[:, 3:]
+        table = o_powers[:, :, self.o_exponents] * d_powers[:, :, self.d_exponents]
+        products = table[:, 0, self.columns[0]] * table[:, 1, self.columns[1]] * table[:, 2, self.columns[2]]
+        return products @ self.weights
+
+def powers(values, n):
+    # values^0 .. values^n along a new last axis
+    result = np.ones(values.shape + (n + 1,))
+    for e in range(1, n + 1):
+        result[..., e] = result[..., e - 1] * values
+    return result
+
+# Roots in u in [0, 1] by Bernstein subdivision: in the Bernstein basis of a
+# segment the coefficients bound the polynomial there (convex hull) and have
+# at least as many sign changes as it has roots, with the same parity. A
+# segment without sign changes holds no root, one with a single change holds
+# exactly one, which safeguarded Newton finds; any other is halved (de
+# Casteljau) until one of these holds or it is RootDepth halvings deep, where
+# a double root (a ray touching the surface) is taken as a hit at its middle.
+RootDepth = 30
+RootIterations = 40
+
+def bernstein_matrix(n):
+    # monomial coefficients on [0, 1] (rows) to Bernstein coefficients (columns)
+    matrix = np.zeros((n + 1, n + 1))
+    for i in range(n + 1):
+        for k in range(i + 1):
+            matrix[k, i] = comb(i, k) / comb(n, k)
+    return matrix
+
+def sign_changes(b):
+    positive = [value > 0 for value in b]
+    return sum(first != second for first, second in zip(positive, positive[1:]))
+
+def split(b):
+    # de Casteljau at the middle: Bernstein coefficients of both halves
+    left, right = [b[0]], [b[-1]]
+    while len(b) > 1:
+        b = [(first + second) * 0.5 for first, second in zip(b, b[1:])]
+        left.append(b[0])
+        right.append(b[-1])
+    return left, right[::-1]
+
+def evaluate(coefficients, u):
+    value = slope = 0.0
+    for c in reversed(coefficients):
+        slope = slope * u + value
+        value = value * u + c
+    return value, slope
+
+def solve_bracket(coefficients, low, high, value_low):
+    # the single root in [low, high], where the values at the ends differ in sign
+    u = (low + high) * 0.5
+    for _ in range(RootIterations):
+        value, slope = evaluate(coefficients, u)
+        if value == 0.0:
+            return u
+        if (value > 0) == (value_low > 0):
+            low, value_low = u, value
+        else:
+            high = u
+        step = u - value / slope if slope != 0.0 else low
+        # Newton while it stays inside the bracket, bisection otherwise
+        step = step if low < step < high else (low + high) * 0.5
+        if abs(step - u) < 1e-15:
+            return step
+        u = step
+    return u
+
+def first_root(coefficients, b):
+    # smallest root in (0, 1) of one polynomial, None if there is none;
+    # coefficients and Bernstein coefficients b as lists of floats
+    # depth first, left half first: the first root found is the smallest
+    stack = [(0.0, 1.0, b, 0)]
+    while stack:
+        low, high, b, depth = stack.pop()
+        changes = sign_changes(b)
+        if changes == 0:
+            continue
+        if changes == 1 and (b[0] > 0) != (b[-1] > 0):
+            u = solve_bracket(coefficients, low, high, b[0])
+        elif depth >= RootDepth:
+            u = (low + high) * 0.5
+        else:
+            left, right = split(b)
+            middle = (low + high) * 0.5
+            stack.append((middle, high, right, depth + 1))
+            stack.append((low, middle, left, depth + 1))
+            continue
+        if u > 0.0:
+            return u
+    return None
+
+def first_roots(coefficients, matrix):
+    # first_root() of N polynomials ((N, degree + 1) array), an array with inf
+    # where there is none; matrix is bernstein_matrix(degree). Breadth first
+    # over the segments of every polynomial at once: the segments that hold a
+    # single root are put aside and solved together at the end, and the end
+    # of the first of them bounds the first root, so later segments are dropped
+    n = coefficients.shape[1] - 1
+    bound = np.full(len(coefficients), np.inf)
+    index = np.arange(len(coefficients))
+    low, width = np.zeros(len(index)), np.ones(len(index))
+    b = coefficients @ matrix
+    found = list()
+    for depth in range(RootDepth + 1):
+        live = low < bound[index]
+        index, low, width, b = index[live], low[live], width[live], b[live]
+        positive = b > 0
+        changes = (positive[:, 1:] != positive[:, :-1]).sum(axis=1)
+        isolated = (changes == 1) & (positive[:, 0] != positive[:, -1])
+        # double roots at the depth limit go along, unbracketed
+        solved = np.flatnonzero(isolated | ((changes > 1) & (depth == RootDepth)))
+        found.append((index[solved], low[solved], width[solved], b[solved, 0], isolated[solved]))
+        # with f(low) != 0 the root is past low, so past 0 as well
+        inside = solved[b[solved, 0] != 0]
+        np.minimum.at(bound, index[inside], low[inside] + width[inside])
+        halve = np.flatnonzero((changes > 1) & ~isolated)
+        if not len(halve) or depth == RootDepth:
+            break
+        index, low, width, b = index[halve], low[halve], width[halve] * 0.5, b[halve]
+        left, right = np.empty_like(b), np.empty_like(b)
+        left[:, 0], right[:, n] = b[:, 0], b[:, n]
+        for r in range(1, n + 1):
+            b = (b[:, :-1] + b[:, 1:]) * 0.5
+            left[:, r], right[:, n - r] = b[:, 0], b[:, -1]
+        index = np.concatenate([index, index])
+        low = np.concatenate([low, low + width])
+        width = np.concatenate([width, width])
+        b = np.concatenate([left, right])
+
+    best = np.full(len(coefficients), np.inf)
+    index, low, width, value_low, bracketed = (np.concatenate(column) for column in zip(*found))
+    live = low < bound[index]
+    index, low, width, value_low, bracketed = index[live], low[live], width[live], value_low[live], bracketed[live]
+    if len(index):
+        u = solve_brackets(coefficients[index], low, low + width, value_low, bracketed)
+        # several segments of one polynomial: minimum.at keeps the smallest
+        np.minimum.at(best, index, np.where(u > 0, u, np.inf))
+    return best
+
+def solve_brackets(coefficients, low, high, value_low, bracketed):
+    # solve_bracket() of M polynomials at once; where bracketed is False
+    # (double roots at the depth limit) the middle of the segment is kept
+    u = (low + high) * 0.5
+    for _ in range(RootIterations):
+        value = np.zeros(len(u))
+        slope = np.zeros(len(u))
+        for c in coefficients.T[::-1]:
+            slope = slope * u + value
+            value = value * u + c
+        same = (value > 0) == (value_low > 0)
+        low = np.where(same, u, low)
+        value_low = np.where(same, value, value_low)
+        high = np.where(same, high, u)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = u - value / slope
+        step = np.where((low < step) & (step < high), step, (low + high) * 0.5)
+        step = np.where((value == 0) | ~bracketed, u, step)
+        if np.abs(step - u).max() < 1e-15:
+            return step
+        u = step
+    return u
@@ -1,8 +1,10 @@
 class Ray:
-    def __init__(self, origin, direction, depth=3):
+    def __init__(self, origin, direction, depth=3, samples=None):
         self.origin = origin
         self.direction = direction.normalize()
         self.depth = depth  # for recursion depth if needed
+        # the sampler's light dimensions of this path, see src/sampler.py
+        self.samples = samples
 
     def point_at_parameter(self, t):
         return self.origin + self.direction * t
\ No newline at end of file
@@ -0,0 +1,48 @@
+import numpy as np
+
+# Counter-based random numbers (Philox-4x32-10, Salmon et al. 2011).
+# A random value is a pure function of (key, counter): there is no generator
+# state to seed, fork or share between workers, and any subset of the values,
+# e.g. every sample of a whole tile, comes out of one vectorized call.
+# The sampler uses counters (row, column, sample, dimension block) under the
+# key (seed, stream), so a pixel's numbers never depend on who renders it.
+
+PhiloxM0 = np.uint64(0xD2511F53)
+PhiloxM1 = np.uint64(0xCD9E8D57)
+PhiloxW0 = np.uint32(0x9E3779B9)
+PhiloxW1 = np.uint32(0xBB67AE85)
+PhiloxRounds = 10
+
+LowBits = np.uint64(0xffffffff)
+Shift32 = np.uint64(32)
+
+def philox4x32(counters, key):
+    # counters (..., 4) and key (2,) of uint32 -> (..., 4) uint32 random words
+    counters = np.asarray(counters, dtype=np.uint32)
+    c0, c1, c2, c3 = (counters[..., k] for k in range(4))
+    k0, k1 = np.uint32(key[0]), np.uint32(key[1])
+    with np.errstate(over='ignore'):
+        for r in range(PhiloxRounds):
+            product0 = PhiloxM0 * c0.astype(np.uint64)
+            product1 = PhiloxM1 * c2.astype(np.uint64)
+            hi0 = (product0 >> Shift32).astype(np.uint32)
+            lo0 = (product0 & LowBits).astype(np.uint32)
+            hi1 = (product1 >> Shift32).astype(np.uint32)
+            lo1 = (product1 & LowBits).astype(np.uint32)
+            c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+            k0, k1 = k0 + PhiloxW0, k1 + PhiloxW1
+    return np.stack([c0, c1, c2, c3], axis=-1)
+
+def uniform(counters, key):
+    # (..., 4) floats in [0, 1), one per 32-bit word
+    return philox4x32(counters, key).astype(np.float64) * (1.0 / 2**32)
+
+def sample_uniforms(key, rows, columns, samples, dimensions):
+    # array of shape (len(rows), len(columns), len(samples), dimensions):
+    # counter (row, column, sample, d // 4) holds dimensions d .. d + 3
+    blocks = np.arange((dimensions + 3) // 4, dtype=np.uint32)
+    grid = np.meshgrid(np.asarray(rows, dtype=np.uint32), np.asarray(columns, dtype=np.uint32),
+                       np.asarray(samples, dtype=np.uint32), blocks, indexing='ij')
+    values = uniform(np.stack(grid, axis=-1), key)
+    shape = values.shape[:3] + (len(blocks) * 4,)
+    return values.reshape(shape)[..., :dimensions]
@@ -0,0 +1,190 @@
+import numpy as np
+
+from .rng import sample_uniforms
+
+# Samplers hand out the random numbers of each pixel as an n x dimensions array
+# in [0, 1). Dimensions come in pairs, one per 2D decision along the path:
+#   (0, 1)          anti-aliasing offset inside the pixel
+#   (2, 3)          position on the lens (CameraDoF)
+#   (4 + 2l, 5 + 2l) position on light l (AreaLight)
+# pixel(i, j, first, n) returns the samples first .. first + n - 1 of the pixel,
+# so adaptive sampling can ask for more and (for the low-discrepancy samplers)
+# keep extending the same sequence; tile() does the same for a block of pixels.
+# Every sampler is a pure function of (seed, pixel, sample index): nothing
+# depends on the global random state, the worker or the render order.
+PixelDims = 2
+LensDims = 2
+LightDims = 2
+
+def sample_dimensions(num_lights):
+    return PixelDims + LensDims + LightDims * num_lights
+
+class Sampler:
+    def __init__(self, dimensions, seed=None):
+        self.dimensions = dimensions
+        # scrambles are a function of (seed, pixel) only, never of the render order
+        self.seed = int(seed if seed is not None else np.random.randint(2**32)) & 0xffffffff
+
+    def pixel(self, i, j, first, n):
+        raise NotImplementedError("pixel method not implemented")
+
+    def tile(self, tile, first, n):
+        # samples of every pixel of tile (i0, i1, j0, j1), shape (i1 - i0, j1 - j0, n, dimensions)
+        i0, i1, j0, j1 = tile
+        return np.array([[self.pixel(i, j, first, n) for j in range(j0, j1)] for i in range(i0, i1)])
+
+    def pixel_seed(self, i, j):
+        return hash_u32(np.uint32(self.seed) ^ hash_u32(np.uint32(i) ^ hash_u32(np.uint32(j))))
+
+class IndependentSampler(Sampler):
+    # uniform random numbers from the counter-based generator in src/rng.py
+    def pixel(self, i, j, first, n):
+        return self.tile((i, i + 1, j, j + 1), first, n)[0, 0]
+
+    def tile(self, tile, first, n):
+        # the whole tile in one vectorized call
+        i0, i1, j0, j1 = tile
+        return sample_uniforms((self.seed, IndependentStream), range(i0, i1), range(j0, j1),
+                               range(first, first + n), self.dimensions)
+
+class StratifiedSampler(Sampler):
+    # every pair of dimensions is jittered on its own grid of at least n cells
+    # and shuffled independently ("padding"), so the pairs stay uncorrelated.
+    # Each call is stratified on its own: adaptive batches are separate grids
+    def pixel(self, i, j, first, n):
+        nx = int(np.ceil(np.sqrt(n)))
+        ny = (n + nx - 1) // nx
+        cells = np.stack(np.meshgrid(np.arange(nx), np.arange(ny), indexing='ij'), axis=-1).reshape(-1, 2)
+        pairs = (self.dimensions + 1) // 2
+        # per cell and pair: a sort key for the shuffle and the 2D jitter,
+        # all under the counter of the batch's first sample
+        uniforms = sample_uniforms((self.seed, StratifiedStream), [i], [j], [first],
+                                   3 * pairs * len(cells))[0, 0, 0].reshape(len(cells), 3 * pairs)
+        samples = np.empty((n, self.dimensions))
+        for p, d in enumerate(range(0, self.dimensions, 2)):
+            k = min(2, self.dimensions - d)
+            chosen = np.argsort(uniforms[:, 3 * p])[:n]
+            points = (cells[chosen] + uniforms[chosen, 3 * p + 1:3 * p + 3]) / (nx, ny)
+            samples[:, d:d + k] = points[:, :k]
+        return samples
+
+class SobolSampler(Sampler):
+    # Padded 2D Sobol (0,2)-sequence with hash-based Owen scrambling (Burley 2020):
+    # every pair of dimensions scrambles both the sample values and the sample
+    # index with its own seed, which keeps each pair a well distributed net for
+    # any prefix (so adaptive batches extend it) and decorrelates the pairs
+    def pixel(self, i, j, first, n):
+        index = np.arange(first, first + n, dtype=np.uint32)
+        pixel_seed = self.pixel_seed(i, j)
+        samples = np.empty((n, self.dimensions))
+        for d in range(0, self.dimensions, 2):
+            seed = hash_u32(pixel_seed ^ np.uint32(d))
+            shuffled = nested_uniform_scramble(index, seed)
+            samples[:, d] = to_unit(nested_uniform_scramble(reverse_bits(shuffled), hash_u32(seed ^ np.uint32(1))))
+            if d + 1 < self.dimensions:
+                samples[:, d + 1] = to_unit(nested_uniform_scramble(sobol_second(shuffled), hash_u32(seed ^ np.uint32(2))))
+        return samples
+
+class HaltonSampler(Sampler):
+    # Halton sequence, dimension d uses the radical inverse in the d-th prime;
+    # each pixel gets a random rotation (Cranley-Patterson) of every dimension
+    def __init__(self, dimensions, seed=None):
+        super().__init__(dimensions, seed)
+        self.bases = first_primes(dimensions)
+
+    def pixel(self, i, j, first, n):
+        index = np.arange(first, first + n)
+        pixel_seed = self.pixel_seed(i, j)
+        samples = np.empty((n, self.dimensions))
+        for d, base in enumerate(self.bases):
+            shift = to_unit(hash_u32(pixel_seed ^ np.uint32(d)))
+            samples[:, d] = (radical_inverse(index, base) + shift) % 1.0
+        return samples
+
+# second half of the Philox key, one stream per use of the generator
+IndependentStream = 0
+StratifiedStream = 1
+
+Samplers = {
+    'independent': IndependentSampler,
+    'stratified': StratifiedSampler,
+    'sobol': SobolSampler,
+    'halton': HaltonSampler,
+}
+
+def make_sampler(name, dimensions, seed=None):
+    return Samplers[name](dimensions, seed)
+
+# --- integer helpers, all on uint32 arrays wrapping modulo 2^32 ---
+
+def hash_u32(x):
+    # murmur3 finalizer
+    x = np.asarray(x, dtype=np.uint32)
+    with np.errstate(over='ignore'):
+        x = x ^ (x >> np.uint32(16))
+        x = x * np.uint32(0x85ebca6b)
+        x = x ^ (x >> np.uint32(13))
+        x = x * np.uint32(0xc2b2ae35)
+        x = x ^ (x >> np.uint32(16))
+    return x
+
+def reverse_bits(x):
+    x = np.asarray(x, dtype=np.uint32)
+    x = ((x >> np.uint32(1)) & np.uint32(0x55555555)) | ((x & np.uint32(0x55555555)) << np.uint32(1))
+    x = ((x >> np.uint32(2)) & np.uint32(0x33333333)) | ((x & np.uint32(0x33333333)) << np.uint32(2))
+    x = ((x >> np.uint32(4)) & np.uint32(0x0f0f0f0f)) | ((x & np.uint32(0x0f0f0f0f)) << np.uint32(4))
+    x = ((x >> np.uint32(8)) & np.uint32(0x00ff00ff)) | ((x & np.uint32(0x00ff00ff)) << np.uint32(8))
+    return (x >> np.uint32(16)) | (x << np.uint32(16))
+
+def laine_karras_permutation(x, seed):
+    # hash that only propagates bits upwards: on bit-reversed values it is an
+    # Owen scramble (each bit flipped as a function of the more significant ones)
+    with np.errstate(over='ignore'):
+        x = x + seed
+        x = x ^ (x * np.uint32(0x6c50b47c))
+        x = x ^ (x * np.uint32(0xb82f1e52))
+        x = x ^ (x * np.uint32(0xc7afe638))
+        x = x ^ (x * np.uint32(0x8d22f6e6))
+    return x
+
+def nested_uniform_scramble(x, seed):
+    return reverse_bits(laine_karras_permutation(reverse_bits(x), seed))
+
+# direction numbers of the second Sobol dimension (primitive polynomial x + 1);
+# the first dimension is the van der Corput sequence, i.e. reverse_bits(index)
+SobolDirections = [0x80000000]
+for _ in range(31):
+    SobolDirections.append(SobolDirections[-1] ^ (SobolDirections[-1] >> 1))
+SobolDirections = np.array(SobolDirections, dtype=np.uint32)
+
+def sobol_second(index):
+    x = np.zeros_like(index)
+    bit = 0
+    while bit < 32 and (index >> np.uint32(bit)).any():
+        set_bit = ((index >> np.uint32(bit)) & np.uint32(1)).astype(bool)
+        x[set_bit] ^= SobolDirections[bit]
+        bit += 1
+    return x
+
+def to_unit(x):
+    # uint32 fixed point to a float in [0, 1)
+    return np.asarray(x, dtype=np.float64) * (1.0 / 2**32)
+
+def radical_inverse(index, base):
+    index = np.array(index, dtype=np.int64)
+    result = np.zeros(index.shape)
+    scale = 1.0 / base
+    while index.any():
+        result += (index % base) * scale
+        index //= base
+        scale /= base
+    return result
+
+def first_primes(n):
+    primes = list()
+    candidate = 2
+    while len(primes) < n:
+        if all(candidate % p for p in primes):
+            primes.append(candidate)
+        candidate += 1
+    return primes
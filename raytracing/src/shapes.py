@@ -1,14 +1,29 @@
-from src.vector3d import Vector3D
+from src.vector3d import Vector3D, vec_to_np, np_to_vec
 from .base import Shape, HitRecord, CastEpsilon
+from .interval import Interval
+from .dual import Dual
+from .polynomial import (polynomial_terms, evaluate_terms, derivative_terms, RayRestriction,
+                         bernstein_matrix, first_root, first_roots)
 import math
 import numpy as np
+
+# row-wise helpers for the hit_batch kernels (arrays of N x 3)
+def dot_rows(a, b):
+    return np.einsum('ij,ij->i', a, b)
+
+def normalize_rows(v):
+    length = np.linalg.norm(v, axis=1, keepdims=True)
+    return v / np.where(length == 0, 1.0, length)
+
 class Ball(Shape):
+    vectorized = True
+
     def __init__(self, center, radius):
         super().__init__("ball")
         self.center = center
         self.radius = radius
 
-    def hit(self, ray):
+    def intersect(self, ray, t_min=CastEpsilon, t_max=float('inf')):
         # Ray-sphere intersection
         oc = ray.origin - self.center
         a = ray.direction.dot(ray.direction)
@@ -16,39 +31,82 @@ class Ball(Shape):
         c = oc.dot(oc) - self.radius * self.radius
         discriminant = b * b - 4 * a * c
         if discriminant < 0:
-            return HitRecord(False, float('inf'), None, None)
-        else:
-            hit, point, normal = False, None, None
-            t = (-b - discriminant**0.5) / (2.0 * a)
-            if t > CastEpsilon:
-                hit = True
-                point = ray.point_at_parameter(t)
-                normal = (point - self.center).normalize()
-            else:
-                t = (-b + discriminant**0.5) / (2.0 * a)
-                if t > CastEpsilon:
-                    hit = True
-                    point = ray.point_at_parameter(t)
-                    normal = (point - self.center).normalize()
+            return None
+        t = (-b - discriminant**0.5) / (2.0 * a)
+        if t >= t_max:
+            # the whole ball is past the interval
+            return None
+        if t <= t_min:
+            # we are inside the ball, use the far root
+            t = (-b + discriminant**0.5) / (2.0 * a)
+            if t <= t_min:
+                return None
+        return t if t < t_max else None
+
+    def surface_info(self, ray, t):
+        point = ray.point_at_parameter(t)
+        normal = (point - self.center).normalize_()
+        return HitRecord(True, t, point, normal)
 
-            return HitRecord(hit, t, point, normal)
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        oc = origins - vec_to_np(self.center)
+        a = dot_rows(directions, directions)
+        b = 2.0 * dot_rows(oc, directions)
+        c = dot_rows(oc, oc) - self.radius * self.radius
+        discriminant = b * b - 4 * a * c
+        sqrt_disc = np.sqrt(np.maximum(discriminant, 0.0))
+        # nearest root in front of the origin, the far one when we are inside
+        t = (-b - sqrt_disc) / (2.0 * a)
+        t = np.where(t > CastEpsilon, t, (-b + sqrt_disc) / (2.0 * a))
+        hit = (discriminant >= 0) & (t > CastEpsilon) & (t < t_max)
+        t = np.where(hit, t, np.inf)
+
+        points = origins + directions * np.where(hit, t, 0.0)[:, None]
+        normal = normalize_rows(points - vec_to_np(self.center))
+        normal[~hit] = 0
+        return t, normal, np.zeros((len(t), 2))
+
+    def bounding_box(self):
+        r = Vector3D(self.radius, self.radius, self.radius)
+        return self.center - r, self.center + r
 
 class Plane(Shape):
+    vectorized = True
+
     def __init__(self, point, normal):
         super().__init__("plane")
         self.point = point
         self.normal = normal.normalize()
 
-    def hit(self, ray):
+    def intersect(self, ray, t_min=CastEpsilon, t_max=float('inf')):
         denom = self.normal.dot(ray.direction)
         if abs(denom) > 1e-6:
             t = (self.point - ray.origin).dot(self.normal) / denom
-            if t >= CastEpsilon:
-                point = ray.point_at_parameter(t)
-                return HitRecord(True, t, point, self.normal)
-        return HitRecord(False, float('inf'), None, None)
+            if t_min < t < t_max:
+                return t
+        return None
+
+    def surface_info(self, ray, t):
+        point = ray.point_at_parameter(t)
+        return HitRecord(True, t, point, self.normal)
+
+    def _plane_batch(self, origins, directions, t_max):
+        normal = vec_to_np(self.normal)
+        denom = directions @ normal
+        safe = np.abs(denom) > 1e-6
+        t = ((vec_to_np(self.point) - origins) @ normal) / np.where(safe, denom, 1.0)
+        hit = safe & (t > CastEpsilon) & (t < t_max)
+        t = np.where(hit, t, np.inf)
+        normals = np.where(hit[:, None], normal, 0.0)
+        return t, normals, hit
+
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        t, normals, _ = self._plane_batch(origins, directions, t_max)
+        return t, normals, np.zeros((len(t), 2))
 
 class PlaneUV(Shape):
+    vectorized = True
+
     def __init__(self, point, normal, forward_direction):
         super().__init__("plane")
         self.point = point
@@ -57,19 +115,25 @@ class PlaneUV(Shape):
         # compute right direction
         self.right_direction = self.normal.cross(self.forward_direction).normalize()
 
-    def hit(self, ray):
-        denom = self.normal.dot(ray.direction)
-        if abs(denom) > 1e-6:
-            t = (self.point - ray.origin).dot(self.normal) / denom
-            if t >= CastEpsilon:
-                point = ray.point_at_parameter(t)
-                # Calculate UV coordinates
-                vec = point - self.point
-                u = vec.dot(self.right_direction)
-                v = vec.dot(self.forward_direction)
-                uv = Vector3D(u, v, 0)
-                return HitRecord(True, t, point, self.normal, uv=uv)
-        return HitRecord(False, float('inf'), None, None)
+    intersect = Plane.intersect
+
+    def surface_info(self, ray, t):
+        point = ray.point_at_parameter(t)
+        # Calculate UV coordinates
+        vec = point - self.point
+        u = vec.dot(self.right_direction)
+        v = vec.dot(self.forward_direction)
+        uv = Vector3D(u, v, 0)
+        return HitRecord(True, t, point, self.normal, uv=uv)
+
+    _plane_batch = Plane._plane_batch
+
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        t, normals, hit = self._plane_batch(origins, directions, t_max)
+        vec = origins + directions * np.where(hit, t, 0.0)[:, None] - vec_to_np(self.point)
+        uv = np.stack([vec @ vec_to_np(self.right_direction), vec @ vec_to_np(self.forward_direction)], axis=1)
+        uv[~hit] = 0
+        return t, normals, uv
 
 class ImplicitFunction(Shape):
     def __init__(self, function):
@@ -80,6 +144,8 @@ class ImplicitFunction(Shape):
         return self.func(point) <= 0
     
 class Cube(Shape):
+    vectorized = True
+
     def __init__(self, center, radius): # radius aqui age como "half_size"
         super().__init__("cube")
         self.center = center
@@ -87,9 +153,9 @@ class Cube(Shape):
         self.min_bound = center - Vector3D(radius, radius, radius)
         self.max_bound = center + Vector3D(radius, radius, radius)
 
-    def hit(self, ray):
-        t_min = 0.0
-        t_max = float('inf')
+    def intersect(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        t_near = 0.0
+        t_far = float('inf')
 
         # Criamos listas auxiliares para poder acessar via índice [i]
         ray_origin = [ray.origin.x, ray.origin.y, ray.origin.z]
@@ -106,7 +172,7 @@ class Cube(Shape):
             if abs(direction_i) < 1e-8:
                 # Raio paralelo ao plano da laje
                 if origin_i < min_i or origin_i > max_i:
-                    return HitRecord(False)
+                    return None
             else:
                 t0 = (min_i - origin_i) / direction_i
                 t1 = (max_i - origin_i) / direction_i
@@ -114,23 +180,60 @@ class Cube(Shape):
                 if t0 > t1:
                     t0, t1 = t1, t0
                 
-                t_min = max(t_min, t0)
-                t_max = min(t_max, t1)
+                t_near = max(t_near, t0)
+                t_far = min(t_far, t1)
 
-                if t_max <= t_min:
-                    return HitRecord(False)
+                # caixa vazia, ou começa depois do intervalo
+                if t_far <= t_near or t_near >= t_max:
+                    return None
 
         # Verifica se o t final é válido
-        t = t_min
-        if t < CastEpsilon:
-            t = t_max
-            if t < CastEpsilon:
-                return HitRecord(False)
-            
+        t = t_near
+        if t <= t_min:
+            t = t_far
+            if t <= t_min:
+                return None
+        return t if t < t_max else None
+
+    def surface_info(self, ray, t):
         point = ray.point_at_parameter(t)
         normal = self._get_normal(point)
-        
         return HitRecord(True, t, point, normal)
+
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        min_b = vec_to_np(self.min_bound)
+        max_b = vec_to_np(self.max_bound)
+
+        # slab test on the 3 axes at once; parallel rays only test containment
+        parallel = np.abs(directions) < 1e-8
+        safe_dir = np.where(parallel, 1.0, directions)
+        t0 = (min_b - origins) / safe_dir
+        t1 = (max_b - origins) / safe_dir
+        t_near = np.where(parallel, -np.inf, np.minimum(t0, t1))
+        t_far = np.where(parallel, np.inf, np.maximum(t0, t1))
+        outside = (parallel & ((origins < min_b) | (origins > max_b))).any(axis=1)
+
+        t_enter = np.maximum(t_near.max(axis=1), 0.0)
+        t_exit = t_far.min(axis=1)
+        t = np.where(t_enter <= CastEpsilon, t_exit, t_enter)
+        hit = ~outside & (t_exit > t_enter) & (t > CastEpsilon) & (t < t_max)
+        t = np.where(hit, t, np.inf)
+
+        # same face classification as _get_normal
+        p = origins + directions * np.where(hit, t, 0.0)[:, None] - vec_to_np(self.center)
+        limit = (self.max_bound.x - self.min_bound.x) / 2.0 / 1.0001
+        on_x = np.abs(p[:, 0]) >= limit
+        on_y = ~on_x & (np.abs(p[:, 1]) >= limit)
+        on_z = ~on_x & ~on_y
+        normal = np.zeros_like(p)
+        normal[on_x, 0] = np.where(p[on_x, 0] > 0, 1.0, -1.0)
+        normal[on_y, 1] = np.where(p[on_y, 1] > 0, 1.0, -1.0)
+        normal[on_z, 2] = np.where(p[on_z, 2] > 0, 1.0, -1.0)
+        normal[~hit] = 0
+        return t, normal, np.zeros((len(t), 2))
+
+    def bounding_box(self):
+        return self.min_bound, self.max_bound
     
     def _get_normal(self, point):
         p = point - self.center
@@ -146,6 +249,8 @@ class Cube(Shape):
             return Vector3D(0, 0, 1 if p.z > 0 else -1)
 
 class Cylinder(Shape):
+    vectorized = True
+
     def __init__(self, center, axis, radius, height):
         super().__init__("cylinder")
         self.center = center
@@ -153,7 +258,7 @@ class Cylinder(Shape):
         self.radius = radius
         self.height = height
 
-    def hit(self, ray):
+    def intersect(self, ray, t_min=CastEpsilon, t_max=float('inf')):
         oc = ray.origin - self.center
 
         rd_dot_axis = ray.direction.dot(self.axis)
@@ -161,14 +266,13 @@ class Cylinder(Shape):
 
         # Vetores perpendiculares (projetados no plano ortogonal ao eixo)
         rd_perp = ray.direction - self.axis * rd_dot_axis
-        oc_perp = oc - self.axis * oc_dot_axis
+        oc_perp = oc.isub(self.axis * oc_dot_axis)
 
         a = rd_perp.dot(rd_perp)
         b = 2.0 * rd_perp.dot(oc_perp)
         c = oc_perp.dot(oc_perp) - self.radius**2
 
-        closest_t = float('inf')
-        hit_record = HitRecord(False)
+        closest_t = t_max
         found_hit = False
 
         # --- 1. Teste do Corpo (Cilindro Infinito recortado) ---
@@ -180,16 +284,14 @@ class Cylinder(Shape):
                 t2 = (-b + sqrt_disc) / (2.0 * a)
 
                 for t in [t1, t2]:
-                    if t > CastEpsilon and t < closest_t:
-                        point = ray.point_at_parameter(t)
-                        dist_along_axis = (point - self.center).dot(self.axis)
+                    if t > t_min and t < closest_t:
+                        # distância ao longo do eixo, sem construir o ponto
+                        dist_along_axis = oc_dot_axis + t * rd_dot_axis
 
                         if -self.height/2.0 <= dist_along_axis <= self.height/2.0:
                             closest_t = t
-                            axis_point = self.center + self.axis * dist_along_axis
-                            normal = (point - axis_point).normalize()
-                            hit_record = HitRecord(True, t, point, normal)
                             found_hit = True
+                            break
 
         # --- 2. Teste das Tampas (Planos circulares) ---
         for sign in [1.0, -1.0]:
@@ -202,26 +304,109 @@ class Cylinder(Shape):
             if abs(denom) > 1e-6:
                 t_cap = (cap_center - ray.origin).dot(cap_normal) / denom
                 
-                if CastEpsilon < t_cap < closest_t:
+                if t_min < t_cap < closest_t:
                     p_cap = ray.point_at_parameter(t_cap)
                     
                     # Teste: O ponto está dentro do círculo da tampa?
-                    v_to_p = p_cap - cap_center
+                    v_to_p = p_cap.isub(cap_center)
                     if v_to_p.dot(v_to_p) <= self.radius**2:
                         closest_t = t_cap
-                        hit_record = HitRecord(True, t_cap, p_cap, cap_normal)
                         found_hit = True
 
-        return hit_record
-    
+        return closest_t if found_hit else None
 
+    def surface_info(self, ray, t):
+        point = ray.point_at_parameter(t)
+        dist_along_axis = (point - self.center).dot(self.axis)
+        axis_point = self.center + self.axis * dist_along_axis
+        radial = point - axis_point
+        # the hit lies on the body or on a cap: take the surface it is closest to
+        cap_gap = abs(abs(dist_along_axis) - self.height / 2.0)
+        if cap_gap < abs(radial.length() - self.radius):
+            normal = self.axis * (1.0 if dist_along_axis > 0 else -1.0)
+        else:
+            normal = radial.normalize_()
+        return HitRecord(True, t, point, normal)
+
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        axis = vec_to_np(self.axis)
+        center = vec_to_np(self.center)
+        n = len(origins)
+        oc = origins - center
+
+        rd_dot_axis = directions @ axis
+        oc_dot_axis = oc @ axis
+        rd_perp = directions - rd_dot_axis[:, None] * axis
+        oc_perp = oc - oc_dot_axis[:, None] * axis
+
+        a = dot_rows(rd_perp, rd_perp)
+        b = 2.0 * dot_rows(rd_perp, oc_perp)
+        c = dot_rows(oc_perp, oc_perp) - self.radius**2
+
+        closest_t = np.array(np.broadcast_to(t_max, (n,)), dtype=float)
+        normal = np.zeros((n, 3))
+        found = np.zeros(n, dtype=bool)
+
+        # --- body: both roots of the infinite cylinder, clipped to the height ---
+        discriminant = b*b - 4*a*c
+        body = (np.abs(a) > 1e-6) & (discriminant >= 0)
+        sqrt_disc = np.sqrt(np.where(body, discriminant, 0.0))
+        safe_a = np.where(body, a, 1.0)
+        for t in ((-b - sqrt_disc) / (2.0 * safe_a), (-b + sqrt_disc) / (2.0 * safe_a)):
+            dist_along_axis = oc_dot_axis + t * rd_dot_axis
+            ok = body & (t > CastEpsilon) & (t < closest_t) & (np.abs(dist_along_axis) <= self.height / 2.0)
+            closest_t[ok] = t[ok]
+            found |= ok
+            radial = oc[ok] + directions[ok] * t[ok, None] - dist_along_axis[ok, None] * axis
+            normal[ok] = normalize_rows(radial)
+
+        # --- caps ---
+        for sign in (1.0, -1.0):
+            cap_center = center + axis * (sign * self.height / 2.0)
+            cap_normal = axis * sign
+            denom = directions @ cap_normal
+            safe = np.abs(denom) > 1e-6
+            t_cap = ((cap_center - origins) @ cap_normal) / np.where(safe, denom, 1.0)
+            v_to_p = origins + directions * t_cap[:, None] - cap_center
+            ok = safe & (t_cap > CastEpsilon) & (t_cap < closest_t) & (dot_rows(v_to_p, v_to_p) <= self.radius**2)
+            closest_t[ok] = t_cap[ok]
+            found |= ok
+            normal[ok] = cap_normal
+
+        t = np.where(found, closest_t, np.inf)
+        return t, normal, np.zeros((n, 2))
+
+    def bounding_box(self):
+        # caps are disks: along each world axis they extend radius * sin(angle to axis)
+        half = self.axis * (self.height / 2.0)
+        a = self.axis
+        extent = Vector3D(
+            self.radius * math.sqrt(max(1.0 - a.x * a.x, 0.0)),
+            self.radius * math.sqrt(max(1.0 - a.y * a.y, 0.0)),
+            self.radius * math.sqrt(max(1.0 - a.z * a.z, 0.0))
+        )
+        p0, p1 = self.center - half, self.center + half
+        bmin = Vector3D(min(p0.x, p1.x), min(p0.y, p1.y), min(p0.z, p1.z)) - extent
+        bmax = Vector3D(max(p0.x, p1.x), max(p0.y, p1.y), max(p0.z, p1.z)) + extent
+        return bmin, bmax
+    
 
-def vec_to_np(v):
-    return np.array([v.x, v.y, v.z])
 
-def np_to_vec(n):
-    return Vector3D(n[0], n[1], n[2])
+def transform_point(m, v):
+    # affine 4x4 (nested lists) applied to a point
+    return Vector3D(
+        m[0][0] * v.x + m[0][1] * v.y + m[0][2] * v.z + m[0][3],
+        m[1][0] * v.x + m[1][1] * v.y + m[1][2] * v.z + m[1][3],
+        m[2][0] * v.x + m[2][1] * v.y + m[2][2] * v.z + m[2][3]
+    )
 
+def transform_direction(m, v):
+    # upper 3x3 of m (nested lists) applied to a direction
+    return Vector3D(
+        m[0][0] * v.x + m[0][1] * v.y + m[0][2] * v.z,
+        m[1][0] * v.x + m[1][1] * v.y + m[1][2] * v.z,
+        m[2][0] * v.x + m[2][1] * v.y + m[2][2] * v.z
+    )
 
 class ObjectTransform(Shape):
     def __init__(self, shape, matrix_4x4):
@@ -244,40 +429,86 @@ class ObjectTransform(Shape):
         #para as normais, usamos a transposta da inversa (apenas a parte 3x3 superior)
         self.inv_transpose_3x3 = self.inverse[:3, :3].T
 
-    def hit(self, ray):
-        orig_4d = np.array([ray.origin.x, ray.origin.y, ray.origin.z, 1.0])
-        dir_4d  = np.array([ray.direction.x, ray.direction.y, ray.direction.z, 0.0])
-
-        orig_obj_4d = self.inverse @ orig_4d
-        dir_obj_4d  = self.inverse @ dir_4d
-
-        orig_obj = Vector3D(orig_obj_4d[0], orig_obj_4d[1], orig_obj_4d[2])
-        dir_obj_raw = Vector3D(dir_obj_4d[0], dir_obj_4d[1], dir_obj_4d[2])
+        # nested lists for the per-ray transforms: plain float math beats
+        # numpy calls on 4-element arrays
+        self.matrix_rows = self.matrix.tolist()
+        self.inverse_rows = self.inverse.tolist()
+        self.inv_transpose_rows = self.inv_transpose_3x3.tolist()
+
+    def object_ray(self, ray):
+        # the ray in object space and the length its direction had before
+        # normalization: t_world = t_object / dir_obj_len (the map is affine)
+        orig_obj = transform_point(self.inverse_rows, ray.origin)
+        dir_obj = transform_direction(self.inverse_rows, ray.direction)
         
-        dir_obj_len = dir_obj_raw.length()
-        dir_obj = dir_obj_raw / dir_obj_len
+        dir_obj_len = dir_obj.length()
+        dir_obj.imul(1.0 / dir_obj_len)
         
-        ray_obj = ray.__class__(origin=orig_obj, direction=dir_obj)
-
-        rec = self.shape.hit(ray_obj)
-
-        if not rec.hit:
-            return rec
-
-        point_obj_4d = np.array([rec.point.x, rec.point.y, rec.point.z, 1.0])
-        point_world_4d = self.matrix @ point_obj_4d
-        point_world = Vector3D(point_world_4d[0], point_world_4d[1], point_world_4d[2])
-
-        normal_obj_np = np.array([rec.normal.x, rec.normal.y, rec.normal.z])
-        normal_world_np = self.inv_transpose_3x3 @ normal_obj_np
-        normal_world = Vector3D(normal_world_np[0], normal_world_np[1], normal_world_np[2]).normalize()
-
-        dist_vec = point_world - ray.origin
-        t_world = dist_vec.dot(ray.direction)
+        return ray.__class__(origin=orig_obj, direction=dir_obj), dir_obj_len
+
+    def intersect(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        ray_obj, dir_obj_len = self.object_ray(ray)
+        # the object-space ray is renormalized, so the interval scales with it
+        t_obj = self.shape.intersect(ray_obj, t_min * dir_obj_len, t_max * dir_obj_len)
+        if t_obj is None:
+            return None
+        t_world = t_obj / dir_obj_len
+        return t_world if t_min < t_world < t_max else None
+
+    def occludes(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        # lets the inner shape use its own any-hit test
+        ray_obj, dir_obj_len = self.object_ray(ray)
+        return self.shape.occludes(ray_obj, t_min * dir_obj_len, t_max * dir_obj_len)
+
+    def occludes_batch(self, origins, directions, t_min, t_max):
+        # like occludes(), the interval scales with the renormalized rays
+        orig_obj = origins @ self.inverse[:3, :3].T + self.inverse[:3, 3]
+        dir_obj = directions @ self.inverse[:3, :3].T
+        dir_obj_len = np.linalg.norm(dir_obj, axis=1)
+        return self.shape.occludes_batch(orig_obj, dir_obj / dir_obj_len[:, None],
+                                         t_min * dir_obj_len, t_max * dir_obj_len)
+
+    def surface_info(self, ray, t):
+        ray_obj, dir_obj_len = self.object_ray(ray)
+        rec = self.shape.surface_info(ray_obj, t * dir_obj_len)
+
+        point_world = transform_point(self.matrix_rows, rec.point)
+        normal_world = transform_direction(self.inv_transpose_rows, rec.normal).normalize_()
 
         final_material = self.material if self.material is not None else rec.material
 
-        return HitRecord(True, t_world, point_world, normal_world, final_material, rec.uv)
+        return HitRecord(True, t, point_world, normal_world, final_material, uv=rec.uv)
+
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        # rays into object space; with normalized object directions t scales by the length
+        orig_obj = origins @ self.inverse[:3, :3].T + self.inverse[:3, 3]
+        dir_obj = directions @ self.inverse[:3, :3].T
+        dir_obj_len = np.linalg.norm(dir_obj, axis=1)
+        dir_obj = dir_obj / dir_obj_len[:, None]
+
+        t_obj, normal_obj, uv = self.shape.hit_batch(orig_obj, dir_obj, t_max * dir_obj_len, need_normals)
+        t = t_obj / dir_obj_len
+        t[t <= CastEpsilon] = np.inf
+        if not need_normals:
+            return t, normal_obj, uv
+        normal = normalize_rows(normal_obj @ self.inv_transpose_3x3.T)
+        return t, normal, uv
+
+    def tighten_bbox(self):
+        self.shape.tighten_bbox()
+
+    def bounding_box(self):
+        box = self.shape.bounding_box()
+        if box is None:
+            return None
+        # transform the 8 corners of the object-space box and bound them again
+        bmin, bmax = box
+        corners = np.array([[x, y, z, 1.0]
+                            for x in (bmin.x, bmax.x)
+                            for y in (bmin.y, bmax.y)
+                            for z in (bmin.z, bmax.z)])
+        world = (self.matrix @ corners.T).T[:, :3]
+        return np_to_vec(world.min(axis=0)), np_to_vec(world.max(axis=0))
 class Paraboloid(Shape):
     def __init__(self, y_min, y_max, material):
         super().__init__("paraboloid")
@@ -286,7 +517,7 @@ class Paraboloid(Shape):
         self.y_max = y_max
         self.material = material
 
-    def hit(self, ray):
+    def intersect(self, ray, t_min=CastEpsilon, t_max=float('inf')):
         ox, oy, oz = ray.origin.x, ray.origin.y, ray.origin.z
         dx, dy, dz = ray.direction.x, ray.direction.y, ray.direction.z
 
@@ -296,56 +527,99 @@ class Paraboloid(Shape):
         b = k*(2*ox*dx + 2*oz*dz) - dy
         c = k*(ox*ox + oz*oz) - oy
 
-        if abs(a) < 1e-6: return HitRecord(False)
+        if abs(a) < 1e-6: return None
 
         delta = b*b - 4*a*c
-        if delta < 0: return HitRecord(False)
+        if delta < 0: return None
 
         sqrt_delta = delta**0.5
         t1 = (-b - sqrt_delta) / (2*a)
         t2 = (-b + sqrt_delta) / (2*a)
 
-        best_t = float('inf')
+        best_t = t_max
         hit_found = False
 
         for t in [t1, t2]:
-            if t > CastEpsilon and t < best_t:
-                p = ray.point_at_parameter(t)
-                if self.y_min <= p.y <= self.y_max:
+            if t > t_min and t < best_t:
+                y = oy + dy * t
+                if self.y_min <= y <= self.y_max:
                     best_t = t
                     hit_found = True
 
-        if hit_found:
-            p = ray.point_at_parameter(best_t)
-            normal = Vector3D(2*p.x, -1, 2*p.z).normalize()
-            # Usa self.material
-            return HitRecord(True, best_t, p, normal, self.material)
-        
-        return HitRecord(False)
+        return best_t if hit_found else None
+
+    def surface_info(self, ray, t):
+        p = ray.point_at_parameter(t)
+        normal = Vector3D(2*p.x, -1, 2*p.z).normalize_()
+        # Usa self.material
+        return HitRecord(True, t, p, normal, self.material)
+
+    def bounding_box(self):
+        # y = x^2 + z^2 clipped to [y_min, y_max]
+        y_top = max(self.y_max, 0.0)
+        r = math.sqrt(y_top)
+        return Vector3D(-r, max(self.y_min, 0.0), -r), Vector3D(r, y_top, r)
 
 class DoubleSidedParaboloid(Paraboloid):
     
-    def hit(self, ray):
+    def surface_info(self, ray, t):
         # 1. Chama o cálculo original
-        rec = super().hit(ray)
-        
-        if rec is not None and rec.normal is not None:
-            try:
-                if ray.direction.dot(rec.normal) > 0:
-                    rec.normal = -rec.normal
-            except:
-                pass
+        rec = super().surface_info(ray, t)
+
+        # a normal sempre aponta contra o raio
+        if ray.direction.dot(rec.normal) > 0:
+            rec.normal.imul(-1)
                 
         return rec
-    
-class NoHit:
-    def __init__(self):
-        self.hit = False
-        self.material = None
-        self.uv = (0,0)
+
+# marching evaluates at most this many points per call of function()
+MarchPoints = 1 << 20
+# a single ray with fewer steps is marched point by point, the arrays don't pay off
+MarchArrayMinSteps = 100
+# sphere tracing of a batch stops when fewer rays than this are still marching
+SphereMarchMinRays = 256
+# interval culling splits segments down to the marching step and, where the
+# bound holds 0 without a sign change at the ends, this many halvings more
+IntervalExtraDepth = 2
+# levels of the octree that tightens the boxes of interval surfaces
+TightenDepth = 5
+# smaller batches don't pay for the interval evaluations
+IntervalMarchMinRays = 256
+OctreeChildren = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)], dtype=float)
 
 class ImplicitSurface(Shape):
-    def __init__(self, material, bbox_min, bbox_max, num_steps=100):
+    # Subclasses whose function(x, y, z) also takes numpy arrays (elementwise,
+    # numpy functions instead of math) set vectorized = True: the marching then
+    # evaluates every step of a ray, or of a whole batch of rays, in one call
+    # (march), bisects all the brackets together (refine_batch) and hit_batch /
+    # occludes_batch become real kernels. Otherwise one point at a time.
+    #
+    # Sphere tracing: a surface that declares a Lipschitz bound of its function
+    # (|f(p) - f(q)| <= L |p - q| where the rays march) or overrides distance()
+    # with a distance estimator steps by the distance bound instead of the fixed
+    # step (t_end - t_start) / num_steps. A step never crosses the surface, so
+    # near it the march falls back to the fixed step, which brackets the root
+    # as before: nothing uniform marching finds is missed, and far from the
+    # surface a few long steps replace most of the evaluations.
+    #
+    # Interval arithmetic: a surface whose function() also runs on Intervals
+    # (src/interval.py) sets interval_arithmetic = True. Batches without a
+    # Lipschitz bound, which sphere tracing uses faster, then bound f over whole
+    # ray segments, drop the segments whose bound excludes 0 and halve the
+    # others down to the marching step, where a sign change at the ends
+    # brackets the root (interval_march): empty space costs a few evaluations
+    # and a root is only missed if it has no sign change even at a quarter of
+    # that step. tighten_bbox() shrinks the box to the cells that can hold the
+    # surface, BaseScene.add() calls it.
+    #
+    # Normals come from gradient(): a closed form where the surface has one,
+    # one evaluation on Duals (src/dual.py, dual forward-mode derivatives) when
+    # dual_numbers = True, central differences otherwise.
+    vectorized = False
+    interval_arithmetic = False
+    dual_numbers = False
+
+    def __init__(self, material, bbox_min, bbox_max, num_steps=100, lipschitz=None):
         try:
             super().__init__(material)
         except:
@@ -355,17 +629,68 @@ class ImplicitSurface(Shape):
         self.bbox_min = bbox_min
         self.bbox_max = bbox_max
         self.num_steps = num_steps
+        self.lipschitz = lipschitz
+        self.sphere_tracing = lipschitz is not None or type(self).distance is not ImplicitSurface.distance
+        # set by tighten_bbox()
+        self.tightened = False
 
     def function(self, x, y, z):
         raise NotImplementedError("Subclasses devem implementar a função implícita")
 
-    def get_normal(self, p):
+    def distance(self, x, y, z, value):
+        # lower bound of the distance from (x, y, z) to the surface, value is
+        # function(x, y, z); works on floats and, when vectorized, on arrays
+        return abs(value) / self.lipschitz
+
+    def gradient(self, x, y, z):
+        # (df/dx, df/dy, df/dz) at floats or, when vectorized, arrays;
+        # surfaces with a closed form override it
+        if self.dual_numbers:
+            f = self.function(Dual(x, 1.0, 0.0, 0.0), Dual(y, 0.0, 1.0, 0.0), Dual(z, 0.0, 0.0, 1.0))
+            return f.dx, f.dy, f.dz
         # Gradiente por Diferenças Finitas
         eps = 1e-4
-        dx = self.function(p.x + eps, p.y, p.z) - self.function(p.x - eps, p.y, p.z)
-        dy = self.function(p.x, p.y + eps, p.z) - self.function(p.x, p.y - eps, p.z)
-        dz = self.function(p.x, p.y, p.z + eps) - self.function(p.x, p.y, p.z - eps)
-        return Vector3D(dx, dy, dz).normalize()
+        f = self.function
+        return (f(x + eps, y, z) - f(x - eps, y, z),
+                f(x, y + eps, z) - f(x, y - eps, z),
+                f(x, y, z + eps) - f(x, y, z - eps))
+
+    def get_normal(self, p):
+        dx, dy, dz = self.gradient(p.x, p.y, p.z)
+        return Vector3D(float(dx), float(dy), float(dz)).normalize_()
+
+    def normal_batch(self, points):
+        # get_normal() of N points (N x 3) with one gradient() on arrays
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+        # partials that don't depend on the point come back as scalars
+        gradient = np.broadcast_arrays(x, *self.gradient(x, y, z))[1:]
+        return normalize_rows(np.stack(gradient, axis=1))
+
+    def bounding_box(self):
+        return self.bbox_min, self.bbox_max
+
+    def tighten_bbox(self):
+        # shrink the box to the octree cells whose interval bound of f holds 0;
+        # shapes reused by several transforms are tightened once
+        if not self.interval_arithmetic or self.tightened:
+            return
+        self.tightened = True
+        low = vec_to_np(self.bbox_min)[None, :]
+        size = vec_to_np(self.bbox_max) - low[0]
+        for _ in range(TightenDepth):
+            size = size * 0.5
+            low = (low[:, None, :] + OctreeChildren[None, :, :] * size).reshape(-1, 3)
+            high = low + size
+            bound = self.function(Interval(low[:, 0], high[:, 0]), Interval(low[:, 1], high[:, 1]),
+                                  Interval(low[:, 2], high[:, 2]))
+            low = low[bound.contains_zero()]
+            if not len(low):
+                return
+        # a margin keeps roots on the faces of the new box inside the march;
+        # plain floats, intersect_box() does scalar math on them
+        margin = size * 1e-3
+        self.bbox_min = Vector3D(*(low.min(axis=0) - margin).tolist())
+        self.bbox_max = Vector3D(*(low.max(axis=0) + size + margin).tolist())
 
     def intersect_box(self, ray):
         # Algoritmo AABB (Slab method)
@@ -388,15 +713,46 @@ class ImplicitSurface(Shape):
             
         return tmin, tmax
 
-    def hit(self, ray):
+    def intersect_box_batch(self, origins, directions):
+        # intersect_box() of N rays, (t_start, t_end) arrays; a miss has
+        # t_end < 0 or t_start > t_end
+        inv_dir = np.full(directions.shape, 1e30)
+        np.divide(1.0, directions, out=inv_dir, where=directions != 0)
+        t1 = (vec_to_np(self.bbox_min) - origins) * inv_dir
+        t2 = (vec_to_np(self.bbox_max) - origins) * inv_dir
+        return np.minimum(t1, t2).max(axis=1), np.maximum(t1, t2).min(axis=1)
+
+    def intersect(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        bracket = self.find_bracket(ray, t_min, t_max)
+        if bracket is None:
+            return None
+        t_final = self.refine(ray, *bracket)
+        if t_min < t_final < t_max:
+            return t_final
+        return None
+
+    def occludes(self, ray, t_min=CastEpsilon, t_max=float('inf')):
+        bracket = self.find_bracket(ray, t_min, t_max)
+        if bracket is None:
+            return False
+        t_low, t_high, _ = bracket
+        # a raiz está garantidamente dentro do intervalo, não precisa bissecção
+        if t_min < t_low and t_high < t_max:
+            return True
+        t_final = self.refine(ray, *bracket)
+        return t_min < t_final < t_max
+
+    def find_bracket(self, ray, t_min, t_max):
+        # (t_low, t_high, f(t_low)) do primeiro passo com troca de sinal, ou None
         # 1. Verifica bounding box
         t_start, t_end = self.intersect_box(ray)
         
-        # Retorna NoHit se errou a caixa (para compatibilidade com ObjectTransform)
-        if t_start is None:
-            return NoHit()
+        # Errou a caixa, ou a caixa está fora do intervalo
+        if t_start is None or t_start >= t_max or t_end <= t_min:
+            return None
 
-        if t_start < 0: t_start = 0
+        # a marcha começa em t_min: uma raiz antes dele esconderia as seguintes
+        t_start = max(t_start, 0.0, t_min)
 
         # 2. Ray Marching
         step_size = (t_end - t_start) / self.num_steps
@@ -404,66 +760,359 @@ class ImplicitSurface(Shape):
         t_curr = t_start
         
         # --- CORREÇÃO 1: Cálculo manual do ponto (sem usar ray.at) ---
-        # p_curr = ray.origin + ray.direction * t_curr
-        p_curr = ray.origin + (ray.direction * t_curr)
+        # p = ray.origin + ray.direction * t, com floats para não alocar vetores
+        ox, oy, oz = ray.origin.x, ray.origin.y, ray.origin.z
+        dx, dy, dz = ray.direction.x, ray.direction.y, ray.direction.z
         # -------------------------------------------------------------
+
+        if self.vectorized and self.num_steps >= MarchArrayMinSteps:
+            # todos os passos do raio numa avaliação só, como em march();
+            # para um raio só é mais rápido que os passos do sphere tracing
+            t = t_start + step_size * np.arange(self.num_steps + 1)
+            vals = self.function(ox + dx * t, oy + dy * t, oz + dz * t)
+            change = (vals[:-1] * vals[1:] <= 0) & (t[1:] > t_min) & (t[:-1] < t_max)
+            k = int(change.argmax())
+            if not change[k]:
+                return None
+            return float(t[k]), float(t[k + 1]), float(vals[k])
+
+        if self.sphere_tracing:
+            # passos do tamanho da distância garantida, nunca menores que step_size
+            t_curr = t_start
+            x, y, z = ox + dx * t_curr, oy + dy * t_curr, oz + dz * t_curr
+            val_curr = self.function(x, y, z)
+            while t_curr < t_max and t_curr < t_end:
+                t_next = min(t_curr + max(self.distance(x, y, z, val_curr), step_size), t_end)
+                x, y, z = ox + dx * t_next, oy + dy * t_next, oz + dz * t_next
+                val_next = self.function(x, y, z)
+                if val_curr * val_next <= 0:
+                    return t_curr, t_next, val_curr
+                t_curr = t_next
+                val_curr = val_next
+            return None
         
-        val_curr = self.function(p_curr.x, p_curr.y, p_curr.z)
+        val_curr = self.function(ox + dx * t_curr, oy + dy * t_curr, oz + dz * t_curr)
         
         for i in range(self.num_steps):
+            # daqui em diante toda raiz fica depois de t_max
+            if t_curr >= t_max: break
             t_next = t_curr + step_size
             if t_next > t_end: break
 
             # --- CORREÇÃO 2 ---
-            p_next = ray.origin + (ray.direction * t_next)
-            val_next = self.function(p_next.x, p_next.y, p_next.z)
+            val_next = self.function(ox + dx * t_next, oy + dy * t_next, oz + dz * t_next)
             
             if val_curr * val_next <= 0:
-                # 3. Refinamento (Bissecção)
-                t_low, t_high = t_curr, t_next
-                
-                for _ in range(10):
-                    t_mid = (t_low + t_high) * 0.5
-                    
-                    # --- CORREÇÃO 3 ---
-                    p_mid = ray.origin + (ray.direction * t_mid)
-                    val_mid = self.function(p_mid.x, p_mid.y, p_mid.z)
-                    
-                    if val_curr * val_mid <= 0:
-                        t_high = t_mid
-                    else:
-                        t_low = t_mid
-                        val_curr = val_mid
-                
-                t_final = t_low
-                # --- CORREÇÃO 4 ---
-                p_final = ray.origin + (ray.direction * t_final)
-                normal = self.get_normal(p_final)
-                
-                # Retorna HitRecord válido
-                return HitRecord(True, t_final, p_final, normal, self.material, (0,0))
+                return t_curr, t_next, val_curr
                 
             t_curr = t_next
             val_curr = val_next
             
-        return NoHit()    
-class HeartSurface(ImplicitSurface):
+        return None
+
+    def refine(self, ray, t_low, t_high, val_low):
+        # 3. Refinamento (Bissecção)
+        ox, oy, oz = ray.origin.x, ray.origin.y, ray.origin.z
+        dx, dy, dz = ray.direction.x, ray.direction.y, ray.direction.z
+        for _ in range(10):
+            t_mid = (t_low + t_high) * 0.5
+            
+            # --- CORREÇÃO 3 ---
+            val_mid = self.function(ox + dx * t_mid, oy + dy * t_mid, oz + dz * t_mid)
+            
+            if val_low * val_mid <= 0:
+                t_high = t_mid
+            else:
+                t_low = t_mid
+                val_low = val_mid
+        return t_low
+
+    def march(self, origins, directions, t_min, t_max):
+        # find_bracket() of N rays: arrays t_low, t_high, val_low, with t_low inf
+        # where there is no sign change. The steps of every ray are the rows of
+        # one array and the first sign change of each row is found with argmax;
+        # with sphere tracing the batch takes its distance steps first and only
+        # the rays left over get the uniform steps, from where they stopped
+        n = len(origins)
+        t_min = np.broadcast_to(t_min, (n,))
+        t_max = np.broadcast_to(t_max, (n,))
+        t_low = np.full(n, np.inf)
+        t_high = np.full(n, np.inf)
+        val_low = np.zeros(n)
+
+        # 1. Verifica bounding box
+        t_start, t_end = self.intersect_box_batch(origins, directions)
+        inside = (t_end >= 0) & (t_start <= t_end) & (t_start < t_max) & (t_end > t_min)
+        rows = np.flatnonzero(inside)
+        if len(rows) == 0:
+            return t_low, t_high, val_low
+        # the march starts at t_min, a root before it would hide the later ones
+        start = np.maximum(np.maximum(t_start[rows], 0), t_min[rows])
+        step_size = (t_end[rows] - start) / self.num_steps
+        num_steps = self.num_steps
+        # with a Lipschitz bound sphere tracing goes first, it is faster than
+        # the interval march
+        if self.sphere_tracing and len(rows) >= SphereMarchMinRays:
+            rows, start, step_size, num_steps = self.sphere_march(origins, directions, rows, start, step_size,
+                                                                  t_end, t_max, t_low, t_high, val_low)
+        if self.interval_arithmetic and len(rows) >= IntervalMarchMinRays:
+            self.interval_march(origins, directions, rows, start, step_size, t_end, t_max, t_low, t_high, val_low)
+            return t_low, t_high, val_low
+
+        # 2. Ray Marching, todos os passos de todos os raios de uma vez
+        steps = np.arange(num_steps + 1)
+        chunk = max(MarchPoints // len(steps), 1)
+        for first in range(0, len(rows), chunk):
+            r = rows[first:first + chunk]
+            local = slice(first, first + chunk)
+            t = np.minimum(start[local, None] + step_size[local, None] * steps, t_end[r, None])
+            p = origins[r, None, :] + directions[r, None, :] * t[:, :, None]
+            vals = self.function(p[:, :, 0], p[:, :, 1], p[:, :, 2])
+            change = (vals[:, :-1] * vals[:, 1:] <= 0) & (t[:, 1:] > t_min[r, None]) & (t[:, :-1] < t_max[r, None])
+            found = np.flatnonzero(change.any(axis=1))
+            k = change[found].argmax(axis=1)
+            t_low[r[found]] = t[found, k]
+            t_high[r[found]] = t[found, k + 1]
+            val_low[r[found]] = vals[found, k]
+        return t_low, t_high, val_low
+
+    def sphere_march(self, origins, directions, rows, start, step_size, t_end, t_max, t_low, t_high, val_low):
+        # the sphere tracing loop of find_bracket() for the rays `rows` at once:
+        # every iteration steps the rays still marching with one evaluation and
+        # writes the brackets found to t_low, t_high, val_low. Iterations cost
+        # the same for few rays as for many, so once fewer than
+        # SphereMarchMinRays are left the rest of their segments go back to
+        # march(): returns those rays, where they are and their uniform steps
+        t = start.copy()
+        p = origins[rows] + directions[rows] * t[:, None]
+        val = self.function(p[:, 0], p[:, 1], p[:, 2])
+        end, limit = t_end[rows], t_max[rows]
+        # a ray grazing a corner of the box has nothing to march (step_size 0)
+        active = np.flatnonzero((t < limit) & (t < end))
+        while len(active) >= SphereMarchMinRays:
+            step = np.maximum(self.distance(p[active, 0], p[active, 1], p[active, 2], val[active]), step_size[active])
+            t_next = np.minimum(t[active] + step, end[active])
+            p[active] = origins[rows[active]] + directions[rows[active]] * t_next[:, None]
+            val_next = self.function(p[active, 0], p[active, 1], p[active, 2])
+            change = val[active] * val_next <= 0
+            found = active[change]
+            t_low[rows[found]] = t[found]
+            t_high[rows[found]] = t_next[change]
+            val_low[rows[found]] = val[found]
+            t[active] = t_next
+            val[active] = val_next
+            active = active[~change & (t_next < end[active]) & (t_next < limit[active])]
+        left = (end[active] - t[active]) / step_size[active]
+        num_steps = int(np.ceil(left.max())) if len(active) else 0
+        return rows[active], t[active], step_size[active], num_steps
+
+    def interval_march(self, origins, directions, rows, start, step_size, t_end, t_max, t_low, t_high, val_low):
+        # the brackets of the rays `rows` by interval culling: every level bounds
+        # f over all the live segments of all the rays in one evaluation
+        o, d = origins[rows], directions[rows]
+        min_width = step_size / 2 ** IntervalExtraDepth
+        best = np.full(len(rows), np.inf)
+        ray = np.arange(len(rows))
+        a, b = start, np.minimum(t_end[rows], t_max[rows])
+        while len(ray):
+            # segments after a bracket already found can't hold the first root
+            live = a < best[ray]
+            ray, a, b = ray[live], a[live], b[live]
+            p_a = o[ray] + d[ray] * a[:, None]
+            p_b = o[ray] + d[ray] * b[:, None]
+            low, high = np.minimum(p_a, p_b), np.maximum(p_a, p_b)
+            bound = self.function(Interval(low[:, 0], high[:, 0]), Interval(low[:, 1], high[:, 1]),
+                                  Interval(low[:, 2], high[:, 2]))
+            live = bound.contains_zero()
+            ray, a, b, p_a, p_b = ray[live], a[live], b[live], p_a[live], p_b[live]
+
+            # segments as short as a marching step: a sign change at the ends is a bracket
+            split = (b - a) > step_size[ray]
+            leaf = np.flatnonzero(~split)
+            val_a = self.function(p_a[leaf, 0], p_a[leaf, 1], p_a[leaf, 2])
+            val_b = self.function(p_b[leaf, 0], p_b[leaf, 1], p_b[leaf, 2])
+            change = val_a * val_b <= 0
+            found = leaf[change]
+            # the earliest bracket of each ray
+            order = np.lexsort((a[found], ray[found]))
+            first = order[np.unique(ray[found][order], return_index=True)[1]]
+            found, val_found = found[first], val_a[change][first]
+            better = a[found] < best[ray[found]]
+            found, val_found = found[better], val_found[better]
+            best[ray[found]] = a[found]
+            t_low[rows[ray[found]]] = a[found]
+            t_high[rows[ray[found]]] = b[found]
+            val_low[rows[ray[found]]] = val_found
+            # no sign change: maybe two roots close together, or just a loose bound
+            unresolved = leaf[~change]
+            split[unresolved] = (b[unresolved] - a[unresolved]) > min_width[ray[unresolved]]
+
+            ray, a, b = ray[split], a[split], b[split]
+            mid = (a + b) * 0.5
+            ray = np.concatenate([ray, ray])
+            a, b = np.concatenate([a, mid]), np.concatenate([mid, b])
+
+    def refine_batch(self, origins, directions, t_low, t_high, val_low):
+        # refine() of N brackets, all bisected together
+        for _ in range(10):
+            t_mid = (t_low + t_high) * 0.5
+            p = origins + directions * t_mid[:, None]
+            val_mid = self.function(p[:, 0], p[:, 1], p[:, 2])
+            left = val_low * val_mid <= 0
+            t_high = np.where(left, t_mid, t_high)
+            t_low = np.where(left, t_low, t_mid)
+            val_low = np.where(left, val_low, val_mid)
+        return t_low
+
+    def hit_batch(self, origins, directions, t_max=float('inf'), need_normals=True):
+        if not self.vectorized:
+            return super().hit_batch(origins, directions, t_max, need_normals)
+        n = len(origins)
+        t_max = np.broadcast_to(t_max, (n,))
+        t = np.full(n, np.inf)
+        normal = np.zeros((n, 3))
+        t_low, t_high, val_low = self.march(origins, directions, CastEpsilon, t_max)
+        rows = np.flatnonzero(np.isfinite(t_low))
+        if len(rows) == 0:
+            return t, normal, np.zeros((n, 2))
+        t_hit = self.refine_batch(origins[rows], directions[rows], t_low[rows], t_high[rows], val_low[rows])
+        hit = (t_hit > CastEpsilon) & (t_hit < t_max[rows])
+        rows, t_hit = rows[hit], t_hit[hit]
+        t[rows] = t_hit
+        if need_normals:
+            normal[rows] = self.normal_batch(origins[rows] + directions[rows] * t_hit[:, None])
+        return t, normal, np.zeros((n, 2))
+
+    def occludes_batch(self, origins, directions, t_min, t_max):
+        if not self.vectorized:
+            return super().occludes_batch(origins, directions, t_min, t_max)
+        t_min = np.broadcast_to(t_min, (len(origins),))
+        t_max = np.broadcast_to(t_max, (len(origins),))
+        t_low, t_high, val_low = self.march(origins, directions, t_min, t_max)
+        # a raiz está garantidamente dentro do intervalo, não precisa bissecção
+        blocked = (t_min < t_low) & (t_high < t_max)
+        rows = np.flatnonzero(np.isfinite(t_low) & ~blocked)
+        if len(rows) == 0:
+            return blocked
+        t_hit = self.refine_batch(origins[rows], directions[rows], t_low[rows], t_high[rows], val_low[rows])
+        blocked[rows] = (t_min[rows] < t_hit) & (t_hit < t_max[rows])
+        return blocked
+
+    def surface_info(self, ray, t):
+        # --- CORREÇÃO 4 ---
+        p_final = ray.origin + (ray.direction * t)
+        normal = self.get_normal(p_final)
+        return HitRecord(True, t, p_final, normal, self.material)
+
+class PolynomialSurface(ImplicitSurface):
+    # Algebraic surface sum(c x^i y^j z^k) = 0 given by its monomial terms
+    # {(i, j, k): c}; with terms=None they are read off function(), which a
+    # subclass writes as usual (src/polynomial.py).
+    # Rays are not marched: along a ray f is a polynomial in t whose
+    # coefficients come in closed form (RayRestriction) and its first root in
+    # the box is solved for (first_roots), a whole batch at once. find_bracket()
+    # and march() hand the root over as a bracket of width 0 and refine() keeps
+    # it, so intersect(), occludes() and the batch kernels work unchanged.
+    vectorized = True
+    # only for tighten_bbox(), a polynomial runs on Intervals as is
+    interval_arithmetic = True
+
+    def __init__(self, material, terms, bbox_min, bbox_max):
+        if terms is None and type(self).function is PolynomialSurface.function:
+            raise TypeError("PolynomialSurface needs terms or a subclass that overrides function()")
+        super().__init__(material, bbox_min, bbox_max)
+        self.terms = polynomial_terms(self.function) if terms is None else dict(terms)
+        self.gradient_terms = [derivative_terms(self.terms, axis) for axis in range(3)]
+        self.restriction = RayRestriction(self.terms)
+        self.bernstein = bernstein_matrix(self.restriction.degree)
+
+    def function(self, x, y, z):
+        return evaluate_terms(self.terms, x, y, z)
+
+    def gradient(self, x, y, z):
+        return tuple(evaluate_terms(terms, x, y, z) for terms in self.gradient_terms)
+
+    def roots(self, origins, directions, t_min, t_max):
+        # first root t_min < t < t_max in the box of each of N rays, inf if none
+        n = len(origins)
+        t = np.full(n, np.inf)
+        t_start, t_end = self.intersect_box_batch(origins, directions)
+        # a little past the box, roots on its faces are hits too
+        margin = (t_end - t_start) * 1e-6
+        low = np.maximum(np.maximum(t_start - margin, 0), t_min)
+        high = np.minimum(t_end + margin, t_max)
+        rows = np.flatnonzero(low < high)
+        if len(rows) == 0:
+            return t
+        # the span [low, high] of each ray becomes u in [0, 1], which keeps
+        # the coefficients of similar size
+        low, span = low[rows], high[rows] - low[rows]
+        coefficients = self.restriction.coefficients(origins[rows] + directions[rows] * low[:, None],
+                                                     directions[rows] * span[:, None])
+        t[rows] = low + first_roots(coefficients, self.bernstein) * span
+        return t
+
+    def find_bracket(self, ray, t_min, t_max):
+        # roots() of a single ray, the root search in plain floats
+        t_start, t_end = self.intersect_box(ray)
+        if t_start is None:
+            return None
+        margin = (t_end - t_start) * 1e-6
+        low = max(t_start - margin, 0.0, t_min)
+        span = min(t_end + margin, t_max) - low
+        if span <= 0:
+            return None
+        o, d = ray.origin, ray.direction
+        coefficients = self.restriction.coefficients(
+            np.array([[o.x + d.x * low, o.y + d.y * low, o.z + d.z * low]]),
+            np.array([[d.x * span, d.y * span, d.z * span]]))
+        u = first_root(coefficients[0].tolist(), (coefficients[0] @ self.bernstein).tolist())
+        if u is None:
+            return None
+        t = low + u * span
+        return t, t, 0.0
+
+    def refine(self, ray, t_low, t_high, val_low):
+        # the root is exact already
+        return t_low
+
+    def march(self, origins, directions, t_min, t_max):
+        t = self.roots(origins, directions, t_min, np.broadcast_to(t_max, (len(origins),)))
+        return t, t.copy(), np.zeros(len(origins))
+
+    def refine_batch(self, origins, directions, t_low, t_high, val_low):
+        return t_low
+
+class HeartSurface(PolynomialSurface):
+    # grau 6, os termos saem de function()
+
     def __init__(self, material):
         bbox_min = Vector3D(-1.5, -1.5, -1.5)
         bbox_max = Vector3D(1.5, 1.5, 1.5)
-        
-        super().__init__(material, bbox_min, bbox_max, num_steps=60)
+        super().__init__(material, None, bbox_min, bbox_max)
 
     def function(self, x, y, z):
         base = x**2 + (2.25 * z**2) + y**2 - 1
         return (base**3) - (x**2 * y**3) - (0.1125 * z**2 * y**3)
 
-class MitchelSurface(ImplicitSurface):
+    def gradient(self, x, y, z):
+        base = x**2 + (2.25 * z**2) + y**2 - 1
+        base2 = 3 * base**2
+        return (base2 * 2 * x - 2 * x * y**3,
+                base2 * 2 * y - 3 * (x**2 + 0.1125 * z**2) * y**2,
+                base2 * 4.5 * z - 0.225 * z * y**3)
+
+class MitchelSurface(PolynomialSurface):
+    # grau 4
+    # its terms cancel each other, so the interval bounds never exclude 0 and
+    # tighten_bbox() would only cost time
+    interval_arithmetic = False
+
     def __init__(self, material):
         # Expandimos a caixa para a esquerda (de -4.5 a -0.5) pois o centro será -2.5
         bbox_min = Vector3D(-4.5, -2.0, -2.0)
         bbox_max = Vector3D(-0.5, 2.0, 2.0)
-        super().__init__(material, bbox_min, bbox_max, num_steps=200)
+        super().__init__(material, None, bbox_min, bbox_max)
 
     def function(self, x, y, z):
         # Move a superfície 2.5 unidades para a ESQUERDA
@@ -472,4 +1121,11 @@ class MitchelSurface(ImplicitSurface):
         term1 = 4 * (x**4 + r2**2)
         term2 = 17 * (x**2) * r2
         term3 = -20 * (x**2 + r2)
-        return term1 + term2 + term3 + 17
\ No newline at end of file
+        return term1 + term2 + term3 + 17
+
+    def gradient(self, x, y, z):
+        x = x + 2.5
+        r2 = y**2 + z**2
+        # f depende de y e z só por r2
+        d_r2 = 8 * r2 + 17 * x**2 - 20
+        return (16 * x**3 + 34 * x * r2 - 40 * x, d_r2 * 2 * y, d_r2 * 2 * z)
\ No newline at end of file
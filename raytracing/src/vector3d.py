@@ -1,4 +1,9 @@
+import numpy as np
+
 class Vector3D:
+    # no per-instance __dict__: a vector is just its three floats
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x: float, y: float, z: float):
         self.x = x
         self.y = y
@@ -42,4 +47,80 @@ class Vector3D:
         return f"Vector3D({self.x}, {self.y}, {self.z})"
 
     def __neg__(self) -> 'Vector3D':
-        return self.__class__(-self.x, -self.y, -self.z)
\ No newline at end of file
+        return self.__class__(-self.x, -self.y, -self.z)
+
+    def copy(self) -> 'Vector3D':
+        return self.__class__(self.x, self.y, self.z)
+
+    # in-place variants: they modify and return self, so only use them
+    # on vectors nobody else holds (fresh results, local accumulators)
+    def iadd(self, other: 'Vector3D') -> 'Vector3D':
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def isub(self, other: 'Vector3D') -> 'Vector3D':
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def imul(self, scalar: float) -> 'Vector3D':
+        self.x *= scalar
+        self.y *= scalar
+        self.z *= scalar
+        return self
+
+    def iadd_scaled(self, other: 'Vector3D', scalar: float) -> 'Vector3D':
+        # self += other * scalar
+        self.x += other.x * scalar
+        self.y += other.y * scalar
+        self.z += other.z * scalar
+        return self
+
+    def iadd_product(self, a: 'Vector3D', b: 'Vector3D', scalar: float) -> 'Vector3D':
+        # self += (a @ b) * scalar, e.g. material color times light color
+        self.x += a.x * b.x * scalar
+        self.y += a.y * b.y * scalar
+        self.z += a.z * b.z * scalar
+        return self
+
+    def normalize_(self) -> 'Vector3D':
+        mag = (self.x * self.x + self.y * self.y + self.z * self.z) ** 0.5
+        if mag == 0:
+            raise ValueError("Cannot normalize a zero-length vector")
+        self.x /= mag
+        self.y /= mag
+        self.z /= mag
+        return self
+
+    # fused helpers
+    def dot_normalized(self, other: 'Vector3D') -> float:
+        # cosine of the angle between self and other, without normalized copies
+        mag = ((self.x * self.x + self.y * self.y + self.z * self.z)
+               * (other.x * other.x + other.y * other.y + other.z * other.z)) ** 0.5
+        if mag == 0:
+            raise ValueError("Cannot normalize a zero-length vector")
+        return (self.x * other.x + self.y * other.y + self.z * other.z) / mag
+
+    def reflect(self, normal: 'Vector3D') -> 'Vector3D':
+        # mirror direction of self about a unit normal: self - 2 (self . n) n
+        k = 2.0 * (self.x * normal.x + self.y * normal.y + self.z * normal.z)
+        return self.__class__(self.x - normal.x * k, self.y - normal.y * k, self.z - normal.z * k)
+
+    def refract(self, normal: 'Vector3D', eta: float):
+        # Snell refraction of the unit direction self through a unit normal facing
+        # against it, eta = n_from / n_to; None on total internal reflection
+        c = -(self.x * normal.x + self.y * normal.y + self.z * normal.z)
+        k = 1 - eta * eta * (1 - c * c)
+        if k < 0:
+            return None
+        m = eta * c - k ** 0.5
+        return self.__class__(self.x * eta + normal.x * m, self.y * eta + normal.y * m, self.z * eta + normal.z * m)
+
+def vec_to_np(v):
+    return np.array([v.x, v.y, v.z])
+
+def np_to_vec(n):
+    return Vector3D(n[0], n[1], n[2])
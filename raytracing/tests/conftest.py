@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import src and the scene modules like raster.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,35 @@
+import numpy as np
+
+from legal_scene import SunflowerSurface
+from src.ray import Ray
+from src.vector3d import Vector3D
+
+# vertical ray through a petal of the sunflower at x=1.5: it enters the
+# surface at t ~ 2.866 and leaves it at t ~ 3.134
+Origin = (1.5, 3.0, 0.0)
+Direction = (0.0, -1.0, 0.0)
+
+def first_root():
+    surface = SunflowerSurface(None)
+    ray = Ray(Vector3D(*Origin), Vector3D(*Direction))
+    return surface, ray, surface.intersect(ray)
+
+def test_second_root_past_t_min():
+    surface, ray, t1 = first_root()
+    assert t1 is not None
+    # the same ray started just past the first root sees the second one
+    moved = Ray(Vector3D(*Origin) + Vector3D(*Direction) * (t1 + 0.01), Vector3D(*Direction))
+    t2 = t1 + 0.01 + surface.intersect(moved)
+    assert abs(surface.intersect(ray, t1 + 0.01, 100.0) - t2) < 1e-3
+    assert surface.occludes(ray, t1 + 0.01, 100.0)
+    assert not surface.occludes(ray, t1 + 0.01, t2 - 0.01)
+
+def test_second_root_past_t_min_batch():
+    surface, _, t1 = first_root()
+    # one ray, and a batch that takes the batch marching paths
+    for n in (1, 300):
+        origins = np.tile(Origin, (n, 1))
+        directions = np.tile(Direction, (n, 1))
+        t_low, _, _ = surface.march(origins, directions, t1 + 0.01, 100.0)
+        assert (t_low > t1 + 0.01).all() and np.isfinite(t_low).all()
+        assert surface.occludes_batch(origins, directions, t1 + 0.01, 100.0).all()